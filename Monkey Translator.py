@@ -117,6 +117,8 @@ dispatcher = bmd.UIDispatcher(ui)
 
 # --- GLOBAL STATE ---
 global_proc = None
+global_queue = None
+global_prefetcher = None  # outlives processors: per-session prefetch spend and paid results
 stop_requested = False
 work_queue = []
 work_index = 0
@@ -132,9 +134,18 @@ def load_config():
         except: pass
     return {"api_key": "", "lang": "es", "custom_prompt": ""}
 
+LANGUAGE_NAMES = {
+    'fr': "French", 'de': "German", 'es': "Spanish", 'it': "Italian", 'en': "English",
+    'pt': "Portuguese", 'nl': "Dutch", 'pl': "Polish", 'ja': "Japanese", 'zh': "Chinese",
+    'ko': "Korean", 'ar': "Arabic", 'ru': "Russian", 'tr': "Turkish",
+}
+
 def save_config(data):
+    # Merge so settings edited by hand in config.json (prefetch etc.) survive
+    cfg = load_config()
+    cfg.update(data)
     try:
-        with open(CONFIG_FILE, 'w') as f: json.dump(data, f)
+        with open(CONFIG_FILE, 'w') as f: json.dump(cfg, f)
     except: pass
 
 # --- UI ---
@@ -153,18 +164,41 @@ def show_window():
                 ui.Label({'Text': "Source Lang:", 'Weight': 0}),
                 ui.ComboBox({'ID': "LangCombo"}), 
             ]),
+            ui.HGroup([
+                ui.Label({'Text': "Target Langs:", 'Weight': 0}),
+                ui.LineEdit({'ID': "TargetLangs", 'Text': ", ".join(cfg.get("target_languages", [])), 'PlaceholderText': "Optional, e.g. fr, de, it"}),
+            ]),
+            ui.HGroup([
+                ui.Label({'Text': "Engine:", 'Weight': 0}),
+                ui.ComboBox({'ID': "EngineCombo"}),
+            ]),
             ui.VGap(10),
         ]),
 
         ui.VGroup({'Weight': 0}, [
             ui.Button({'ID': "BtnAnalyze", 'Text': "1. Analyze & OCR"}),
             ui.Button({'ID': "BtnGenerate", 'Text': "2. Generate Translation"}),
+            ui.CheckBox({'ID': "ImportReadyCheck", 'Text': "Import each clip as soon as it's ready", 'Checked': cfg.get("import_as_ready", False)}),
             ui.Button({'ID': "BtnImport", 'Text': "3. Import to Timeline"}),
             ui.VGap(10),
         ]),
 
+        ui.VGroup({'Weight': 0}, [
+            ui.HGroup([
+                ui.Button({'ID': "BtnQueueTimeline", 'Text': "➕ Queue Timeline"}),
+                ui.Button({'ID': "BtnQueueProject", 'Text': "➕ Queue All in Project"}),
+            ]),
+            ui.HGroup([
+                ui.Button({'ID': "BtnRunQueue", 'Text': "▶ Run Queue"}),
+                ui.Button({'ID': "BtnClearQueue", 'Text': "Clear Finished"}),
+            ]),
+            ui.Label({'ID': "QueueLabel", 'Text': "", 'Alignment': { 'AlignHCenter': True }, 'Color': {'Color': '#888888'}}),
+            ui.VGap(10),
+        ]),
+
         ui.VGroup({'Weight': 0}, [
             ui.Button({'ID': "BtnSingle", 'Text': "⚡ Process Current Clip (Instant)"}),
+            ui.CheckBox({'ID': "PrefetchCheck", 'Text': "Prefetch upcoming clips for Instant", 'Checked': cfg.get("prefetch_enabled", False)}),
             ui.Label({'Text': "Custom Instruction (Optional):"}),
             ui.TextEdit({'ID': "PromptInput", 'Height': 50, 'PlaceholderText': "Default: Translate to French..."}),
         ]),
@@ -180,10 +214,19 @@ def show_window():
         ]),
     ])
 
-    win = dispatcher.AddWindow({ 'ID': 'MonkeyTranslatorWin', 'WindowTitle': 'Monkey Translator V1.0', 'Geometry': [ 500, 300, 400, 500 ] }, layout)
+    win = dispatcher.AddWindow({ 'ID': 'MonkeyTranslatorWin', 'WindowTitle': 'Monkey Translator V1.0', 'Geometry': [ 500, 300, 400, 650 ] }, layout)
     itm = win.GetItems()
     itm['LangCombo'].AddItems(['es', 'fr', 'de', 'it', 'en'])
     itm['LangCombo'].CurrentText = cfg.get('lang', 'es')
+    ENGINES = {"Gemini AI": "gemini", "Local (remove text only)": "local_inpaint"}
+    itm['EngineCombo'].AddItems(list(ENGINES))
+    itm['EngineCombo'].CurrentText = next((k for k, v in ENGINES.items() if v == cfg.get("generation_backend")), "Gemini AI")
+
+    def apply_engine():
+        """Selected engine -> processor (batch, Instant and prefetch all follow it)."""
+        backend = ENGINES.get(itm['EngineCombo'].CurrentText, "gemini")
+        if global_proc: global_proc.settings["generation_backend"] = backend
+        return backend
     itm['PromptInput'].PlainText = cfg.get("custom_prompt", "")
 
     def update_status(msg):
@@ -195,15 +238,25 @@ def show_window():
         itm['BtnGenerate'].Enabled = not running
         itm['BtnImport'].Enabled = not running
         itm['BtnSingle'].Enabled = not running
+        itm['BtnRunQueue'].Enabled = not running
         itm['BtnStop'].Enabled = running
 
-    def get_current_prompt():
+    def get_target_languages():
+        text = itm['TargetLangs'].Text or ""
+        return [l.strip().lower() for l in text.replace(';', ',').split(',') if l.strip()]
+
+    def get_current_prompt(lang=None):
+        language = LANGUAGE_NAMES.get(lang, lang) if lang else "French"
         user_text = itm['PromptInput'].PlainText
         if user_text and user_text.strip():
-            return user_text.strip()
+            user_text = user_text.strip()
+            if not lang: return user_text
+            # Multi-language job: {lang} in the instruction is replaced, otherwise the target is appended
+            if "{lang}" in user_text: return user_text.replace("{lang}", language)
+            return f"{user_text}\nTarget language: {language}."
         prompt = (
             "Perform a realistic text replacement. Detect all text in this image and "
-            "translate it into French. \n"
+            f"translate it into {language}. \n"
             "REQUIREMENTS:\n"
             "1. Replace the text in-place. strictly matching the original font style, "
             "size, color, weight, and perspective/orientation.\n"
@@ -214,6 +267,32 @@ def show_window():
         )
         return prompt
 
+    def confirm(title, text):
+        """Small modal Yes/Cancel dialog; returns True on Yes."""
+        dlg = dispatcher.AddWindow({ 'ID': 'ConfirmWin', 'WindowTitle': title, 'Geometry': [ 550, 350, 420, 220 ] }, ui.VGroup([
+            ui.Label({'Text': text, 'WordWrap': True}),
+            ui.HGroup({'Weight': 0}, [
+                ui.Button({'ID': "BtnConfirmYes", 'Text': "Generate"}),
+                ui.Button({'ID': "BtnConfirmNo", 'Text': "Cancel"}),
+            ]),
+        ]))
+        result = {'ok': False}
+
+        def on_yes(ev):
+            result['ok'] = True
+            dispatcher.ExitLoop()
+
+        def on_no(ev):
+            dispatcher.ExitLoop()
+
+        dlg.On.BtnConfirmYes.Clicked = on_yes
+        dlg.On.BtnConfirmNo.Clicked = on_no
+        dlg.On.ConfirmWin.Close = on_no
+        dlg.Show()
+        dispatcher.RunLoop()
+        dlg.Hide()
+        return result['ok']
+
     # --- MAIN LOOP ---
     def process_next_step(ev):
         global work_index, stop_requested, valid_ocr_images
@@ -221,20 +300,34 @@ def show_window():
         try:
             if stop_requested:
                 update_status("🛑 Stopped.")
+                if work_mode == "JOBS": global_queue.resume()
+                elif global_proc: print(global_proc.finish_run())
                 set_running(False)
                 return
 
+            if work_mode == "JOBS":
+                busy, msg = global_queue.step()
+                update_status(msg)
+                itm['QueueLabel'].Text = global_queue.summary()
+                if not busy:
+                    set_running(False)
+                    return
+                ui.QueueEvent(itm['BtnTicker'], "Clicked", {})
+                return
+
             if work_index >= len(work_queue):
                 if work_mode == "OCR":
                     update_status(f"Mapping {len(valid_ocr_images)} images...")
                     global_proc.create_json_map(valid_ocr_images)
-                    update_status("Analysis Complete.")
+                    update_status(f"Analysis Complete. {global_proc.finish_run(drop_ocr=True)}")
                 elif work_mode == "GEMINI":
-                    update_status("Generation Complete.")
+                    update_status(f"Generation Complete. {global_proc.finish_run()}")
                 
                 set_running(False)
                 return
 
+            # Nearest-to-playhead / marked clips first, re-evaluated every step
+            if work_mode == "GEMINI": global_proc.prioritize(work_queue, work_index)
             item = work_queue[work_index]
             
             if work_mode == "OCR":
@@ -244,8 +337,13 @@ def show_window():
                 if has_text: valid_ocr_images.append(item.name)
 
             elif work_mode == "GEMINI":
-                update_status(f"Gemini ({work_index+1}/{len(work_queue)}): {item['name']}")
-                global_proc.step_gemini(item, get_current_prompt())
+                pack = global_proc.next_pack(work_queue, work_index)
+                if len(pack) > 1: update_status(f"Gemini ({work_index+1}-{work_index+len(pack)}/{len(work_queue)}): {len(pack)} packed")
+                else: update_status(f"Gemini ({work_index+1}/{len(work_queue)}): {item['name']}")
+                prompts = {lang: get_current_prompt(lang) for lang in global_proc.output_languages()}
+                for done_item, lang, ok in global_proc.step_gemini_fanout(pack, prompts):
+                    if ok and itm['ImportReadyCheck'].Checked: global_proc.import_item(done_item, lang)
+                work_index += len(pack) - 1
 
             work_index += 1
             ui.QueueEvent(itm['BtnTicker'], "Clicked", {})
@@ -253,6 +351,7 @@ def show_window():
         except Exception as e:
             update_status("Error in Loop (See Console)")
             traceback.print_exc()
+            if global_proc: global_proc.memory.stop()
             set_running(False)
 
     # --- HANDLERS ---
@@ -262,7 +361,7 @@ def show_window():
         update_status("Stopping...")
 
     def on_single(ev):
-        global global_proc
+        global global_proc, global_prefetcher
         try:
             update_status("⚡ Processing Single Clip...")
 
@@ -276,7 +375,8 @@ def show_window():
                     import processor
                     importlib.reload(processor)
                     from processor import GeminiProcessor
-                    global_proc = GeminiProcessor(resolve, resolve.GetProjectManager().GetCurrentProject(), key)
+                    global_proc = GeminiProcessor(resolve, resolve.GetProjectManager().GetCurrentProject(), key, load_config())
+                    if itm['PrefetchCheck'].Checked: global_prefetcher = global_proc.start_prefetch(global_prefetcher)
                 except:
                     update_status("Error loading processor.")
                     return
@@ -284,6 +384,7 @@ def show_window():
             global_proc.api_key = key
             from google import genai
             global_proc.client = genai.Client(api_key=key)
+            apply_engine()
 
             success, msg = global_proc.run_single_clip_workflow(get_current_prompt())
             update_status(msg)
@@ -293,7 +394,7 @@ def show_window():
             traceback.print_exc()
 
     def on_analyze(ev):
-        global global_proc, work_queue, work_index, work_mode, stop_requested, valid_ocr_images
+        global global_proc, global_prefetcher, work_queue, work_index, work_mode, stop_requested, valid_ocr_images
         try:
             key = itm['ApiKey'].Text
             p_text = itm['PromptInput'].PlainText
@@ -303,8 +404,11 @@ def show_window():
             importlib.reload(processor)
             from processor import GeminiProcessor
             
-            global_proc = GeminiProcessor(resolve, resolve.GetProjectManager().GetCurrentProject(), key)
+            if global_proc: global_proc.stop_prefetch()
+            global_proc = GeminiProcessor(resolve, resolve.GetProjectManager().GetCurrentProject(), key, load_config())
             global_proc.ensure_structure()
+            # The paused prefetcher moves to the new processor (same spend, same results)
+            if itm['PrefetchCheck'].Checked: global_prefetcher = global_proc.start_prefetch(global_prefetcher)
             
             update_status("Exporting Stills...")
             global_proc.grab_stills()
@@ -315,6 +419,7 @@ def show_window():
             valid_ocr_images = []
             work_mode = "OCR"
             stop_requested = False
+            global_proc.start_run()
             
             set_running(True)
             ui.QueueEvent(itm['BtnTicker'], "Clicked", {})
@@ -330,12 +435,24 @@ def show_window():
             from google import genai
             global_proc.client = genai.Client(api_key=itm['ApiKey'].Text)
             
-            save_config({"api_key": itm['ApiKey'].Text, "lang": itm['LangCombo'].CurrentText, "custom_prompt": itm['PromptInput'].PlainText})
+            targets = get_target_languages()
+            backend = apply_engine()
+            save_config({"api_key": itm['ApiKey'].Text, "lang": itm['LangCombo'].CurrentText, "custom_prompt": itm['PromptInput'].PlainText, "import_as_ready": itm['ImportReadyCheck'].Checked, "target_languages": targets, "generation_backend": backend})
+            global_proc.languages = targets
+
+            # Dry run first: show what this will cost and wait for a yes
+            if global_proc.settings["confirm_before_generate"]:
+                prompts = {lang: get_current_prompt(lang) for lang in global_proc.output_languages()}
+                plan_text = global_proc.format_plan(global_proc.plan_generation(prompts))
+                print(plan_text)
+                if not confirm("Generation Plan", plan_text):
+                    return update_status("Generation cancelled.")
 
             work_queue = global_proc.get_gemini_list()
             work_index = 0
             work_mode = "GEMINI"
             stop_requested = False
+            global_proc.start_run()
             
             set_running(True)
             ui.QueueEvent(itm['BtnTicker'], "Clicked", {})
@@ -350,16 +467,116 @@ def show_window():
                  import processor
                  importlib.reload(processor)
                  from processor import GeminiProcessor
-                 global_proc = GeminiProcessor(resolve, resolve.GetProjectManager().GetCurrentProject(), itm['ApiKey'].Text)
+                 global_proc = GeminiProcessor(resolve, resolve.GetProjectManager().GetCurrentProject(), itm['ApiKey'].Text, load_config())
+            global_proc.languages = get_target_languages()
             success, msg = global_proc.import_to_timeline()
             update_status(msg)
         except Exception as e:
             update_status("Error")
             traceback.print_exc()
 
+    # --- JOB QUEUE ---
+    def get_queue():
+        global global_queue
+        if not global_queue:
+            import processor
+            importlib.reload(processor)
+            import job_queue
+            importlib.reload(job_queue)
+            global_queue = job_queue.JobQueue(resolve, itm['ApiKey'].Text, load_config())
+        return global_queue
+
+    def get_job_prompts():
+        targets = get_target_languages()
+        if not targets: return {"": get_current_prompt()}
+        return {lang: get_current_prompt(lang) for lang in targets}
+
+    def on_queue_timeline(ev):
+        try:
+            project = resolve.GetProjectManager().GetCurrentProject()
+            tl = project.GetCurrentTimeline()
+            if not tl: return update_status("No timeline open.")
+            queue = get_queue()
+            queue.enqueue(project.GetName(), tl.GetName(), get_job_prompts(), itm['LangCombo'].CurrentText, ENGINES.get(itm['EngineCombo'].CurrentText, "gemini"))
+            itm['QueueLabel'].Text = queue.summary()
+            update_status(f"Queued: {tl.GetName()}")
+        except Exception as e:
+            update_status("Queue Error (See Console)")
+            traceback.print_exc()
+
+    def on_queue_project(ev):
+        try:
+            project = resolve.GetProjectManager().GetCurrentProject()
+            queue = get_queue()
+            count = queue.enqueue_project(project, get_job_prompts(), itm['LangCombo'].CurrentText, ENGINES.get(itm['EngineCombo'].CurrentText, "gemini"))
+            itm['QueueLabel'].Text = queue.summary()
+            update_status(f"Queued {count} timelines from {project.GetName()}.")
+        except Exception as e:
+            update_status("Queue Error (See Console)")
+            traceback.print_exc()
+
+    def on_run_queue(ev):
+        global global_proc, global_queue, work_mode, stop_requested
+        try:
+            save_config({"api_key": itm['ApiKey'].Text, "lang": itm['LangCombo'].CurrentText, "custom_prompt": itm['PromptInput'].PlainText})
+            # The queue switches projects/timelines: the interactive processor would go stale
+            if global_proc: global_proc.stop_prefetch()
+            global_proc = None
+            global_queue = None
+            queue = get_queue()
+            queue.resume()
+            work_mode = "JOBS"
+            stop_requested = False
+            set_running(True)
+            ui.QueueEvent(itm['BtnTicker'], "Clicked", {})
+        except Exception as e:
+            update_status("Queue Error (See Console)")
+            traceback.print_exc()
+
+    def on_clear_queue(ev):
+        queue = get_queue()
+        queue.clear_finished()
+        itm['QueueLabel'].Text = queue.summary()
+
+    # --- PREFETCH ---
+    def on_prefetch_toggle(ev):
+        global global_proc, global_prefetcher
+        enabled = itm['PrefetchCheck'].Checked
+        save_config({"prefetch_enabled": enabled})
+        if not enabled:
+            if global_proc: global_proc.stop_prefetch()
+            prefetch_timer.Stop()
+            return
+        try:
+            key = itm['ApiKey'].Text
+            if not global_proc:
+                import processor
+                importlib.reload(processor)
+                from processor import GeminiProcessor
+                global_proc = GeminiProcessor(resolve, resolve.GetProjectManager().GetCurrentProject(), key, load_config())
+            from google import genai
+            global_proc.client = genai.Client(api_key=key)
+            global_prefetcher = global_proc.start_prefetch(global_prefetcher)
+            prefetch_timer.Start()
+            update_status("Prefetch on.")
+        except Exception as e:
+            update_status("Prefetch Error (See Console)")
+            traceback.print_exc()
+
+    def on_prefetch_tick(ev):
+        # Don't touch the playhead while a batch is stepping through the timeline
+        if not global_proc or not global_proc.prefetcher or itm['BtnStop'].Enabled: return
+        try:
+            apply_engine()
+            global_proc.prefetcher.update(get_current_prompt())
+        except Exception as e:
+            traceback.print_exc()
+
     def on_close(ev):
         global stop_requested
         stop_requested = True
+        prefetch_timer.Stop()
+        if global_prefetcher: global_prefetcher.shutdown()
         win.Hide()
         dispatcher.ExitLoop()
 
@@ -369,6 +586,16 @@ def show_window():
     win.On.BtnImport.Clicked = on_import
     win.On.BtnStop.Clicked = on_stop
     win.On.BtnTicker.Clicked = process_next_step
+    win.On.PrefetchCheck.Clicked = on_prefetch_toggle
+    win.On.BtnQueueTimeline.Clicked = on_queue_timeline
+    win.On.BtnQueueProject.Clicked = on_queue_project
+    win.On.BtnRunQueue.Clicked = on_run_queue
+    win.On.BtnClearQueue.Clicked = on_clear_queue
+
+    # Polls the playhead for the prefetcher (Resolve has no playhead event)
+    prefetch_timer = ui.Timer({'ID': "PrefetchTimer", 'Interval': 500})
+    dispatcher.On.Timeout = on_prefetch_tick
+    if itm['PrefetchCheck'].Checked: on_prefetch_toggle(None)
     win.On.MonkeyTranslatorWin.Close = on_close
 
     win.Show()
@@ -0,0 +1,77 @@
+import sys
+import os
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+# Compares OCR backends on a folder of exported stills:
+#   python benchmark_ocr.py "~/Documents/Monkey Translator/<Project> - <Timeline>/TEMP/EXP_STILLS"
+#   python benchmark_ocr.py <folder> --model "~/Documents/Monkey Translator/models/text_det.onnx" --int8
+# Every backend runs in its own process so cold start and memory are measured cleanly.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def run_worker(args):
+    start = time.perf_counter()
+    sys.path.insert(0, SCRIPT_DIR)
+    from processor import DEFAULT_SETTINGS, create_ocr_backend, peak_rss_mb
+
+    settings = dict(DEFAULT_SETTINGS, ocr_backend=args.worker, ocr_onnx_model=args.model or "", ocr_onnx_int8=args.int8)
+    backend = create_ocr_backend(settings, args.lang)
+    cold_start = time.perf_counter() - start
+
+    images = sorted(Path(args.folder).glob("*.jpg"))[:args.frames]
+    timings, with_text = [], 0
+    for img in images:
+        t = time.perf_counter()
+        if backend.has_text(img): with_text += 1
+        timings.append((time.perf_counter() - t) * 1000)
+
+    timings.sort()
+    print(json.dumps({
+        "backend": args.worker + (" (int8)" if args.int8 and args.worker == "onnx" else ""),
+        "cold_start_s": cold_start,
+        "frames": len(timings),
+        "with_text": with_text,
+        "median_ms": statistics.median(timings) if timings else 0,
+        "p95_ms": timings[int(len(timings) * 0.95) - 1] if timings else 0,
+        "rss_mb": peak_rss_mb(),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR backends (cold start, per-frame latency, peak RSS).")
+    parser.add_argument("folder", help="Folder of .jpg stills (e.g. TEMP/EXP_STILLS)")
+    parser.add_argument("--backends", default="easyocr,onnx")
+    parser.add_argument("--model", help="ONNX text detection model (default: ~/Documents/Monkey Translator/models/text_det.onnx)")
+    parser.add_argument("--int8", action="store_true", help="Quantize the ONNX model to int8")
+    parser.add_argument("--lang", default="es")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker: return run_worker(args)
+
+    rows = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        cmd = [sys.executable, os.path.abspath(__file__), args.folder, "--worker", backend, "--lang", args.lang, "--frames", str(args.frames)]
+        if args.model: cmd += ["--model", args.model]
+        if args.int8: cmd += ["--int8"]
+        print(f"Running {backend}...")
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        if proc.returncode or not lines:
+            print(f"   ❌ {backend} failed:\n{proc.stderr.strip()[-500:]}")
+            continue
+        rows.append(json.loads(lines[-1]))
+
+    if not rows: return
+    print(f"\n{'Backend':<16}{'Cold start':>12}{'Median':>10}{'p95':>10}{'Peak RSS':>11}{'Text':>9}")
+    for r in rows:
+        rss = f"{r['rss_mb']:.0f} MB" if r['rss_mb'] else "n/a"
+        print(f"{r['backend']:<16}{r['cold_start_s']:>10.2f} s{r['median_ms']:>7.0f} ms{r['p95_ms']:>7.0f} ms{rss:>11}{r['with_text']:>5}/{r['frames']}")
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,8 @@ import zipfile
 import io
 import tempfile
 import ssl  # <--- ADDED THIS
+import argparse
+import json
 from pathlib import Path
 
 # =============================================================================
@@ -18,9 +20,12 @@ REPO_NAME   = "MonkeyTranslator"
 BRANCH      = "main"               
 
 PLUGIN_FOLDER_NAME = "MonkeyTranslator" 
-FILES_TO_DEPLOY = ["Monkey Translator.py", "processor.py", "config.json"]
+FILES_TO_DEPLOY = ["Monkey Translator.py", "processor.py", "job_queue.py", "config.json"]
 
-REQUIRED_PACKAGES = ["easyocr", "google-genai", "Pillow"]
+REQUIRED_PACKAGES = ["easyocr", "google-genai", "Pillow", "psutil"]  # psutil: memory ceiling / peak RSS
+
+# Lightweight OCR (installer.py --ocr onnx): no torch; the installer selects "ocr_backend": "onnx" in config.json
+ONNX_PACKAGES = ["onnxruntime", "onnx", "opencv-python-headless", "numpy", "google-genai", "Pillow", "psutil"]  # onnx: int8 quantization
 # =============================================================================
 
 def get_resolve_scripts_dir():
@@ -48,11 +53,22 @@ def get_resolve_scripts_dir():
     if not valid_root: return None
     return valid_root / "Fusion" / "Scripts" / "Edit"
 
-def install_dependencies():
+def install_dependencies(ocr_backend="easyocr"):
     print(f"\n[1/4] Checking GPU & Installing Dependencies...")
     python_exec = sys.executable
     system = platform.system()
 
+    if ocr_backend == "onnx":
+        print(f"   ...Installing {', '.join(ONNX_PACKAGES)} (ONNX OCR, skipping PyTorch)...")
+        try:
+            subprocess.check_call([python_exec, "-m", "pip", "install"] + ONNX_PACKAGES)
+            print("   ✅ Libraries installed.")
+            print('   ℹ️  Place your model at ~/Documents/Monkey Translator/models/text_det.onnx.')
+            return True
+        except subprocess.CalledProcessError:
+            print(f"❌ Error installing libraries.")
+            return False
+
     print("   ...Installing PyTorch...")
     if system == "Windows":
         try:
@@ -82,7 +98,7 @@ def install_dependencies():
         print(f"❌ Error installing libraries.")
         return False
 
-def download_and_deploy(dest_root):
+def download_and_deploy(dest_root, ocr_backend="easyocr"):
     print("\n[2/4] Downloading Source Code from GitHub...")
     final_dest = dest_root / PLUGIN_FOLDER_NAME
     zip_url = f"https://github.com/{GITHUB_USER}/{REPO_NAME}/archive/refs/heads/{BRANCH}.zip"
@@ -132,6 +148,17 @@ def download_and_deploy(dest_root):
                     count += 1
             
             (final_dest / "__init__.py").touch()
+
+            # The ONNX install has no EasyOCR: select the backend it does have
+            if ocr_backend != "easyocr":
+                config_path = final_dest / "config.json"
+                config = {}
+                if config_path.exists():
+                    try: config = json.loads(config_path.read_text(encoding='utf-8'))
+                    except: pass
+                config["ocr_backend"] = ocr_backend
+                config_path.write_text(json.dumps(config, indent=4), encoding='utf-8')
+                print(f'   ✅ config.json: "ocr_backend": "{ocr_backend}"')
             print(f"   ✅ Installed {count} files.")
             return True
 
@@ -140,6 +167,11 @@ def download_and_deploy(dest_root):
         return False
 
 def main():
+    parser = argparse.ArgumentParser(description=f"{PLUGIN_FOLDER_NAME} installer")
+    parser.add_argument("--ocr", choices=["easyocr", "onnx"], default="easyocr",
+                        help="OCR backend to install (onnx: lightweight, no PyTorch)")
+    args = parser.parse_args()
+
     print(f"=== {PLUGIN_FOLDER_NAME} Installer (SSL Fix) ===")
     
     target_path = get_resolve_scripts_dir()
@@ -154,8 +186,8 @@ def main():
              print(f"   sudo python3 \"{sys.argv[0]}\"")
              sys.exit(1)
 
-    if install_dependencies():
-        if download_and_deploy(target_path):
+    if install_dependencies(args.ocr):
+        if download_and_deploy(target_path, args.ocr):
             print("\n" + "="*40)
             print("      INSTALLATION SUCCESSFUL")
             print("="*40)
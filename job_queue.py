@@ -0,0 +1,222 @@
+import gc
+import json
+import time
+from pathlib import Path
+
+from processor import GeminiProcessor, MemoryMonitor, atomic_write
+
+try:
+    from google import genai
+except ImportError:
+    pass
+
+# A job goes through these stages; progress is saved after every step so an
+# interrupted queue (stop, crash, Resolve restart) resumes where it left off.
+STAGES = ["open", "export", "ocr", "generate", "import"]
+
+class JobQueue:
+    """Persistent queue of timelines to translate unattended, across projects.
+
+    The queue is driven one small step at a time (`step()`), like the UI's
+    batch loop, so Resolve stays responsive. The OCR model, Gemini client,
+    response cache (in the work store) and rate budget are shared by every job.
+    """
+    def __init__(self, resolve, api_key, settings=None, path=None):
+        self.resolve = resolve
+        self.api_key = api_key
+        self.settings = dict(settings or {})
+        self.path = Path(path) if path else Path.home() / "Documents" / "Monkey Translator" / "job_queue.json"
+        self.client = None
+        self.readers = {}   # (ocr backend, lang) -> loaded OCR backend
+        self.proc = None
+        self.current = None
+        self.items = None
+        self.jobs = []
+        self.memory = MemoryMonitor()   # peak RSS of the running job
+        self.load()
+
+        if api_key:
+            try: self.client = genai.Client(api_key=api_key)
+            except: pass
+
+    # --- PERSISTENCE ---
+    def load(self):
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f: self.jobs = json.load(f)
+            except: self.jobs = []
+        self.resume()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path, json.dumps(self.jobs, indent=2).encode('utf-8'))
+
+    def resume(self):
+        """Jobs left running by a previous session go back in the queue (stage is kept)."""
+        for job in self.jobs:
+            if job["status"] == "running": job["status"] = "queued"
+        self.memory.stop()
+        self.current = None
+        self.proc = None
+        self.items = None
+
+    # --- QUEUE ---
+    def enqueue(self, project_name, timeline_name, prompts, lang="es", backend="gemini"):
+        """Adds a timeline. `prompts` maps target language ("" for single-language) to prompt."""
+        for job in self.jobs:
+            if job["project"] == project_name and job["timeline"] == timeline_name and job["status"] == "queued":
+                job["prompts"], job["lang"], job["backend"] = prompts, lang, backend
+                self.save()
+                return job
+        job = {
+            "id": f"{int(time.time() * 1000)}_{len(self.jobs)}",
+            "project": project_name,
+            "timeline": timeline_name,
+            "prompts": prompts,
+            "lang": lang,
+            "backend": backend,
+            "status": "queued",
+            "stage": "open",
+            "index": 0,
+            "total": 0,
+            "message": "",
+            "requests": 0,
+            "cache_hits": 0,
+            "peak_rss_mb": None,
+            "updated": time.time(),
+        }
+        self.jobs.append(job)
+        self.save()
+        return job
+
+    def enqueue_project(self, project, prompts, lang="es", backend="gemini"):
+        count = 0
+        for i in range(1, int(project.GetTimelineCount()) + 1):
+            tl = project.GetTimelineByIndex(i)
+            if tl:
+                self.enqueue(project.GetName(), tl.GetName(), prompts, lang, backend)
+                count += 1
+        return count
+
+    def clear_finished(self):
+        self.jobs = [j for j in self.jobs if j["status"] not in ("done", "failed")]
+        self.save()
+
+    def summary(self):
+        counts = {}
+        for job in self.jobs: counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return ", ".join(f"{n} {status}" for status, n in sorted(counts.items())) or "Queue empty"
+
+    # --- RUNNER ---
+    def step(self):
+        """Does one unit of work. Returns (busy, status message)."""
+        if not self.current:
+            self.current = next((j for j in self.jobs if j["status"] == "queued"), None)
+            if not self.current: return False, f"Queue finished ({self.summary()})."
+            self.current["status"] = "running"
+            self.memory.start()
+
+        job = self.current
+        try:
+            # Resumed job (or after a restart): reopen its timeline, keep the saved stage
+            if not self.proc and job["stage"] != "open": self._open(job)
+            msg = getattr(self, f"_stage_{job['stage']}")(job)
+        except Exception as e:
+            self._finish(job, "failed", str(e))
+            msg = f"❌ {job['timeline']}: {e}"
+
+        if self.proc:
+            job["requests"] += self.proc.requests_sent
+            job["cache_hits"] += self.proc.cache_hits
+            self.proc.requests_sent = self.proc.cache_hits = 0
+        job["updated"] = time.time()
+        self.save()
+        return True, msg
+
+    def _next_stage(self, job):
+        job["stage"] = STAGES[STAGES.index(job["stage"]) + 1]
+        job["index"] = 0
+        self.items = None
+        gc.collect()  # nothing decoded in a stage is needed by the next one
+
+    def _finish(self, job, status, message):
+        """Closes a job: records its peak memory and releases its processor."""
+        job["status"], job["message"] = status, message
+        peak, _ = self.memory.stop()
+        job["peak_rss_mb"] = round(peak) if peak else None
+        self.current, self.proc, self.items = None, None, None
+        gc.collect()
+        return self.memory.summary()
+
+    def _stage_open(self, job):
+        self._open(job)
+        self._next_stage(job)
+        return f"Opened {job['project']} / {job['timeline']}."
+
+    def _open(self, job):
+        pm = self.resolve.GetProjectManager()
+        project = pm.GetCurrentProject()
+        if not project or project.GetName() != job["project"]:
+            pm.SaveProject()
+            project = pm.LoadProject(job["project"])
+            if not project: raise RuntimeError(f"Project not found: {job['project']}")
+
+        tl = None
+        for i in range(1, int(project.GetTimelineCount()) + 1):
+            candidate = project.GetTimelineByIndex(i)
+            if candidate and candidate.GetName() == job["timeline"]: tl = candidate; break
+        if not tl: raise RuntimeError(f"Timeline not found: {job['timeline']}")
+        project.SetCurrentTimeline(tl)
+
+        languages = [l for l in job["prompts"] if l]
+        settings = dict(self.settings, generation_backend=job["backend"], target_languages=languages)
+        self.proc = GeminiProcessor(self.resolve, project, self.api_key, settings)
+        self.proc.client = self.client
+        self.proc.reader = self.readers.get((self.proc.settings["ocr_backend"], job["lang"]))
+        self.proc.ocr_lang = job["lang"]
+        self.proc.ensure_structure()
+
+    def _stage_export(self, job):
+        self.proc.grab_stills()
+        self.proc.process_drx()
+        self._next_stage(job)
+        return f"{job['timeline']}: stills exported."
+
+    def _stage_ocr(self, job):
+        if self.items is None: self.items = self.proc.get_images_for_ocr()
+        job["total"] = len(self.items)
+        if job["index"] < len(self.items):
+            if not self.proc.reader:
+                self.proc.init_ocr(job["lang"])
+                self.readers[(self.proc.settings["ocr_backend"], job["lang"])] = self.proc.reader
+            img = self.items[job["index"]]
+            self.proc.step_ocr(img)
+            job["index"] += 1
+            return f"{job['timeline']}: OCR {job['index']}/{job['total']}"
+
+        # The OCR cache holds every result, so this also works after a resume
+        valid = [p.name for p in self.items if self.proc.ocr_cache.get(p.name)]
+        self.proc.create_json_map(valid)
+        self._next_stage(job)
+        return f"{job['timeline']}: {len(valid)} stills with text."
+
+    def _stage_generate(self, job):
+        if self.items is None: self.items = self.proc.get_gemini_list()
+        job["total"] = len(self.items)
+        if job["index"] >= len(self.items):
+            self._next_stage(job)
+            return f"{job['timeline']}: generation complete."
+
+        pack = self.proc.next_pack(self.items, job["index"])
+        prompts = {(lang or None): prompt for lang, prompt in job["prompts"].items()}
+        # A resumed job restarts at the saved index; results already paid for with this
+        # job's prompt come from the response cache (restore_cached), per language
+        self.proc.step_gemini_fanout(pack, prompts)
+        job["index"] += len(pack)
+        return f"{job['timeline']}: Gemini {job['index']}/{job['total']}"
+
+    def _stage_import(self, job):
+        ok, msg = self.proc.import_to_timeline()
+        self.resolve.GetProjectManager().SaveProject()
+        memory = self._finish(job, "done" if ok else "failed", msg)
+        return f"✅ {job['timeline']}: {msg} ({memory})" if ok else f"❌ {job['timeline']}: {msg}"
@@ -1,29 +1,1031 @@
 import os
+import io
 import shutil
 import json
+import math
+import hashlib
 import time
 import ssl
+import sys
+import heapq
+import bisect
+import select
+import threading
+import fnmatch
 import warnings
+import gc
+from contextlib import contextmanager
 from pathlib import Path
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageChops, ImageStat
 
 # --- SILENCE WARNINGS ---
 warnings.filterwarnings("ignore", message=".*pin_memory.*") 
 
 try:
-    import easyocr
     from google import genai
     from google.genai import types
 except ImportError:
     pass 
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# --- DEFAULT SETTINGS (overridable from config.json) ---
+DEFAULT_SETTINGS = {
+    "prefetch_enabled": False,
+    "prefetch_clips_ahead": 2,     # current clip + N upcoming clips with text
+    "prefetch_max_in_flight": 2,   # concurrent speculative Gemini requests
+    "prefetch_max_requests": 20,   # speculative request budget per session
+    "batch_order": "playhead",     # "playhead" (nearest / marked clips first) or "timeline"
+    "import_as_ready": False,      # append each batch result as soon as it is generated
+    "pack_enabled": False,         # combine several stills into one Gemini request
+    "pack_size": 4,                # stills per packed request
+    "pack_max_diff": 20,           # per-tile validation threshold (mean per-channel difference)
+    "target_languages": [],        # e.g. ["fr", "de"]: one analysis, one output folder/bin/track per language
+    "generation_backend": "gemini",   # "gemini" or "local_inpaint" (offline text removal)
+    "inpaint_method": "telea",     # "telea" or "ns" (OpenCV inpainting algorithms)
+    "inpaint_radius": 5,
+    "inpaint_min_confidence": 0.5, # frames with a weaker OCR box are not trusted locally...
+    "local_fallback_to_gemini": True,  # ...and are sent to Gemini instead
+    "store_budget_gb": 50,         # disk budget for ~/Documents/Monkey Translator
+    "store_max_age_days": 0,       # also clean timelines unused for this many days (0 = only when over budget)
+    "ocr_backend": "easyocr",      # "easyocr" or "onnx" (text detection on ONNX Runtime, no torch)
+    "ocr_onnx_model": "",          # exported detection model (DBNet-style, e.g. PaddleOCR det); default ~/Documents/Monkey Translator/models/text_det.onnx
+    "ocr_onnx_int8": False,        # quantize the model to int8 on first use
+    "ocr_onnx_threads": 2,
+    "ocr_onnx_box_thresh": 0.6,    # mean text probability a box needs to count
+    "rate_limit_rpm": 0,           # Gemini requests per minute shared by every job (0 = unlimited)
+    "output_size": "auto",         # Instant/prefetch output: "auto" (smallest that covers the timeline), "1K", "2K", "4K"
+    "upload_max_edge": 1536,       # batch uploads are downscaled to this long edge...
+    "min_text_px": 20,             # ...unless that would make the smallest text shorter than this
+    "resample_to_timeline": True,  # resize results to the exact timeline resolution
+    "confirm_before_generate": True,   # show the dry-run plan before spending
+    "frame_memory_mb": 768,        # decoded-frame budget shared by every worker thread
+    "rss_ceiling_mb": 0,           # above this process RSS, decodes run one at a time (0 = off)
+}
+
+# Planner defaults until a few real requests have been measured
+DEFAULT_REQUEST_SECONDS = 12.0
+DEFAULT_RESPONSE_BYTES = 1200 * 1024
+
+# Approximate long edge (16:9) of each Gemini image_size
+OUTPUT_SIZES = [("1K", 1376), ("2K", 2752), ("4K", 5504)]
+
+# --- EXPORT READINESS ---
+JPEG_EOI = b'\xff\xd9'
+
+def _load_inotify():
+    """Returns libc with inotify symbols on Linux, None elsewhere."""
+    if not sys.platform.startswith("linux"): return None
+    try:
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1; libc.inotify_add_watch
+        return libc
+    except: return None
+
+def is_file_complete(path, last_stat=None):
+    """JPEGs are complete once they end with EOI; anything else once size/mtime stop changing."""
+    try:
+        st = path.stat()
+        if st.st_size == 0: return False, None
+        stat_key = (st.st_size, st.st_mtime)
+        if path.suffix.lower() in ('.jpg', '.jpeg'):
+            with open(path, 'rb') as f:
+                f.seek(max(0, st.st_size - 32))
+                return (JPEG_EOI in f.read().rstrip(b'\x00')), stat_key
+        return (last_stat == stat_key), stat_key
+    except OSError:
+        return False, None
+
+class FileReadyWatcher:
+    """Waits for a file to appear in a folder and finish writing.
+
+    Uses inotify where available so we wake the moment Resolve closes the
+    file, and falls back to a short poll (network shares don't deliver
+    inotify events for remote writes). Open it BEFORE triggering the export
+    so no event is missed.
+    """
+    # IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    IN_MASK = 0x002 | 0x008 | 0x080 | 0x100
+
+    def __init__(self, directory, poll_interval=0.05):
+        self.directory = Path(directory)
+        self.poll_interval = poll_interval
+        self.fd = None
+        libc = _load_inotify()
+        if libc:
+            try:
+                fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+                if fd >= 0 and libc.inotify_add_watch(fd, str(self.directory).encode(), self.IN_MASK) >= 0:
+                    self.fd = fd
+                elif fd >= 0: os.close(fd)
+            except: self.fd = None
+
+    def __enter__(self): return self
+
+    def __exit__(self, *exc): self.close()
+
+    def close(self):
+        if self.fd is not None:
+            try: os.close(self.fd)
+            except OSError: pass
+            self.fd = None
+
+    def _sleep(self, remaining):
+        delay = max(0.0, min(remaining, self.poll_interval))
+        if self.fd is None:
+            time.sleep(delay)
+            return
+        # Wake on the next event, but never sleep past the poll interval
+        ready, _, _ = select.select([self.fd], [], [], delay)
+        if ready:
+            try:
+                while os.read(self.fd, 4096): pass
+            except OSError: pass
+
+    def wait(self, pattern, timeout=10.0):
+        """Returns the first complete file matching `pattern`, or None on timeout."""
+        deadline = time.time() + timeout
+        last_stats = {}
+        while True:
+            try: names = [n for n in os.listdir(self.directory) if fnmatch.fnmatch(n, pattern)]
+            except OSError: names = []
+            for name in sorted(names):
+                path = self.directory / name
+                done, stat_key = is_file_complete(path, last_stats.get(name))
+                if done: return path
+                last_stats[name] = stat_key
+            remaining = deadline - time.time()
+            if remaining <= 0: return None
+            self._sleep(remaining)
+
+# --- IMAGE / IO HELPERS ---
+class PhaseTimer:
+    """Collects a per-phase latency breakdown (seconds)."""
+    def __init__(self):
+        self.phases = []
+        self.start = self._last = time.perf_counter()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    def total(self):
+        return self._last - self.start
+
+    def summary(self):
+        parts = [f"{name} {secs:.2f}s" for name, secs in self.phases]
+        return " | ".join(parts + [f"total {self.total():.2f}s"])
+
+def atomic_write(path, data):
+    """Writes bytes to a temp file next to `path` then renames it into place."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def response_image_bytes(response):
+    """Returns the raw bytes of the first image part in a Gemini response."""
+    if response.parts:
+        for part in response.parts:
+            if part.inline_data and part.inline_data.data:
+                return part.inline_data.data
+    return None
+
+def jpeg_bytes(img):
+    """Encodes only the pixels of a PIL image as JPEG (no metadata carried over)."""
+    if img.mode not in ('RGB', 'L'): img = img.convert('RGB')
+    out = io.BytesIO()
+    # The JPEG encoder only writes EXIF/ICC when passed in; the comment is the one
+    # field it copies from the source, so no pixel copy is needed to drop metadata
+    img.save(out, format="JPEG", quality=95, comment=b"")
+    return out.getvalue()
+
+def clean_jpeg_bytes(raw, size=None):
+    """Decodes an image and re-encodes only its pixels as JPEG (drops all metadata),
+    resampling to `size` (w, h) first when given."""
+    with Image.open(io.BytesIO(raw)) as src:
+        target = tuple(size) if size else tuple(src.size)
+        resize = target != tuple(src.size)
+        if resize: src.draft("RGB", target)  # JPEG reduce-on-load when shrinking 2x or more
+        with FRAME_BUDGET.reserve(frame_bytes(src.size) + (frame_bytes(target) if resize else 0)):
+            img = src.convert("RGB").resize(target, Image.LANCZOS) if resize else src
+            try: return jpeg_bytes(img)
+            finally: img.close()
+
+def downscale_jpeg(data, max_edge):
+    """Returns JPEG bytes with the long edge reduced to `max_edge` (original bytes if already small)."""
+    with Image.open(io.BytesIO(data)) as img:
+        long_edge = max(img.size)
+        if long_edge <= max_edge * 1.05: return data
+        scale = max_edge / long_edge
+        size = (max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale)))
+        img.draft("RGB", size)  # JPEG reduce-on-load
+        with FRAME_BUDGET.reserve(frame_bytes(img.size) + frame_bytes(size)):
+            small = img.convert("RGB").resize(size, Image.LANCZOS)
+            try: return jpeg_bytes(small)
+            finally: small.close()
+
+# --- REQUEST PACKING ---
+PACK_PROMPT = (
+    "This image is a grid of {count} independent video frames ({cols} columns x {rows} rows) "
+    "separated by black lines. Apply the following instruction to EACH frame separately. "
+    "Keep the exact grid layout, the black separators and the overall image dimensions.\n\n"
+)
+
+def build_contact_sheet(paths, sheet_width=2048, gutter=8):
+    """Tiles downscaled stills into one sheet. Returns (sheet, manifest, cols, rows) where
+    each manifest entry holds the still path, its tile box in the sheet, its original size
+    and the downscaled tile (kept for validation)."""
+    cols = math.ceil(math.sqrt(len(paths)))
+    rows = (len(paths) + cols - 1) // cols
+    with Image.open(paths[0]) as first: src_w, src_h = first.size
+    tile_w = (sheet_width - gutter * (cols + 1)) // cols
+    tile_h = max(1, round(tile_w * src_h / src_w))
+    sheet = Image.new("RGB", (sheet_width, gutter + rows * (tile_h + gutter)), (0, 0, 0))
+
+    manifest = []
+    for i, path in enumerate(paths):
+        with Image.open(path) as img:
+            size = img.size
+            img.draft("RGB", (tile_w, tile_h))  # JPEG reduce-on-load
+            with FRAME_BUDGET.reserve(frame_bytes(img.size)):
+                tile = img.convert("RGB").resize((tile_w, tile_h), Image.LANCZOS)
+        x = gutter + (i % cols) * (tile_w + gutter)
+        y = gutter + (i // cols) * (tile_h + gutter)
+        sheet.paste(tile, (x, y))
+        manifest.append({"path": path, "box": (x, y, x + tile_w, y + tile_h), "size": size, "tile": tile})
+    return sheet, manifest, cols, rows
+
+def split_contact_sheet(result, sheet_size, manifest):
+    """Cuts the returned sheet back into tiles, scaling the manifest boxes to the result size."""
+    sx = result.size[0] / sheet_size[0]
+    sy = result.size[1] / sheet_size[1]
+    tiles = []
+    for entry in manifest:
+        x0, y0, x1, y1 = entry["box"]
+        tiles.append(result.crop((round(x0 * sx), round(y0 * sy), round(x1 * sx), round(y1 * sy))))
+    return tiles
+
+def tile_signature(tile):
+    return tile.convert("RGB").resize((64, 36))
+
+def tile_diff(a, b):
+    """Mean per-channel difference of two tile signatures (0-255)."""
+    return sum(ImageStat.Stat(ImageChops.difference(a, b)).mean) / 3
+
+def match_tiles(src_tiles, out_tiles, max_diff, margin=1.5):
+    """For each returned tile: True when it is close to its own source (text edits only
+    touch a small area) and clearly closer to it than to any other source of the sheet.
+    A shuffled grid fails the second test; so do near-identical frames (e.g. consecutive
+    shots of one lower-third), which can't be told apart and go out as single requests."""
+    srcs = [tile_signature(t) for t in src_tiles]
+    matches = []
+    for i, out in enumerate(out_tiles):
+        sig = tile_signature(out)
+        diffs = [tile_diff(src, sig) for src in srcs]
+        own = diffs[i]
+        matches.append(own <= max_diff and all(own * margin < d for j, d in enumerate(diffs) if j != i))
+    return matches
+
+# --- OCR BACKENDS ---
+class EasyOCRBackend:
+    """Text detection/recognition with EasyOCR (torch)."""
+    name = "easyocr"
+
+    def __init__(self, lang):
+        import easyocr
+        # SSL Fix for Mac
+        try:
+            _create_unverified_https_context = ssl._create_unverified_context
+        except AttributeError: pass
+        else: ssl._create_default_https_context = _create_unverified_https_context
+
+        gpu_enable = False
+        try:
+            import torch
+            if torch.cuda.is_available(): gpu_enable = True
+            elif torch.backends.mps.is_available(): gpu_enable = True
+        except: pass
+
+        self.reader = easyocr.Reader([lang], gpu=gpu_enable)
+
+    def _readtext(self, path, **kwargs):
+        # EasyOCR decodes the full frame and keeps a few working copies of it
+        with FRAME_BUDGET.reserve(still_bytes(path, copies=4)):
+            return self.reader.readtext(str(path), detail=1, **kwargs)
+
+    def scan(self, path):
+        """Boxes for the has-text decision: [(bbox (4 points), confidence)]."""
+        result = self._readtext(path, text_threshold=0.85)
+        return [(bbox, float(conf)) for bbox, _, conf in result]
+
+    def has_text(self, path):
+        return bool(self.scan(path))
+
+    def detect(self, path):
+        """Returns [(bbox (4 points), confidence)]."""
+        # Low thresholds: for removal it's better to over-mask than to leave letters behind
+        result = self._readtext(path, text_threshold=0.5, low_text=0.3)
+        return [(bbox, float(conf)) for bbox, _, conf in result]
+
+class OnnxTextDetector:
+    """Text detection only, with an exported DBNet-style model on ONNX Runtime (CPU).
+
+    We only need to know where text is (has_text for the OCR pass, boxes for
+    inpainting), so no recognition model and no torch are loaded.
+    """
+    name = "onnx"
+    MEAN = (0.485, 0.456, 0.406)
+    STD = (0.229, 0.224, 0.225)
+
+    def __init__(self, model_path, int8=False, threads=2, box_thresh=0.6, max_side=960):
+        import onnxruntime as ort
+        if cv2 is None or np is None: raise ImportError("The ONNX OCR backend needs numpy and opencv-python-headless.")
+        model_path = Path(model_path)
+        if not model_path.exists(): raise FileNotFoundError(f"ONNX text detection model not found: {model_path}")
+        if int8: model_path = quantize_onnx_model(model_path)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(threads)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.box_thresh = box_thresh
+        self.max_side = max_side
+
+    def _prob_map(self, path):
+        with Image.open(path) as img:
+            orig_w, orig_h = img.size
+            scale = min(1.0, self.max_side / max(orig_w, orig_h))
+            w = max(32, int(round(orig_w * scale / 32)) * 32)
+            h = max(32, int(round(orig_h * scale / 32)) * 32)
+            img.draft("RGB", (w, h))  # JPEG reduce-on-load
+            # Decoded frame + two float32 copies of the network input
+            with FRAME_BUDGET.reserve(frame_bytes(img.size) + frame_bytes((w, h), copies=8)):
+                small = img.convert("RGB").resize((w, h), Image.BILINEAR)
+                arr = np.asarray(small, dtype=np.float32) / 255.0
+                small.close()
+                arr = (arr - np.array(self.MEAN, np.float32)) / np.array(self.STD, np.float32)
+                tensor = arr.transpose(2, 0, 1)[None]
+                del arr
+                prob = np.squeeze(self.session.run(None, {self.input_name: tensor})[0])
+        return prob, orig_w / w, orig_h / h
+
+    def detect(self, path):
+        """Returns [(bbox (4 points), confidence)] in original image coordinates."""
+        prob, sx, sy = self._prob_map(path)
+        binary = (prob > 0.3).astype(np.uint8)
+        contours = cv2.findContours(binary * 255, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[-2]
+        boxes = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w < 3 or h < 3: continue
+            score = float(prob[y:y + h, x:x + w].mean())
+            if score < self.box_thresh: continue
+            # DB "unclip": the model predicts shrunk text kernels, grow them back
+            pad = w * h * 1.5 / (2 * (w + h))
+            x0, y0 = (x - pad) * sx, (y - pad) * sy
+            x1, y1 = (x + w + pad) * sx, (y + h + pad) * sy
+            boxes.append(([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], score))
+        return boxes
+
+    def scan(self, path):
+        return self.detect(path)
+
+    def has_text(self, path):
+        return bool(self.detect(path))
+
+# Next to the work dirs: the plugin folder is replaced on every reinstall and is
+# root-owned on macOS, so neither the model nor its int8 copy can live there
+MODELS_DIR = Path.home() / "Documents" / "Monkey Translator" / "models"
+
+def quantize_onnx_model(model_path):
+    """Returns an int8 (dynamic quantization) copy of the model, creating it once in MODELS_DIR."""
+    model_path = Path(model_path)
+    int8_path = MODELS_DIR / f"{model_path.stem}.int8.onnx"
+    if not int8_path.exists():
+        MODELS_DIR.mkdir(parents=True, exist_ok=True)
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print(f"Quantizing {model_path.name} to int8...")
+        quantize_dynamic(str(model_path), str(int8_path), weight_type=QuantType.QUInt8)
+    return int8_path
+
+def create_ocr_backend(settings, lang):
+    """Builds the OCR backend selected by settings["ocr_backend"]."""
+    if settings.get("ocr_backend") == "onnx":
+        model = Path(settings.get("ocr_onnx_model") or MODELS_DIR / "text_det.onnx").expanduser()
+        return OnnxTextDetector(
+            model,
+            int8=settings.get("ocr_onnx_int8", False),
+            threads=settings.get("ocr_onnx_threads", 2),
+            box_thresh=float(settings.get("ocr_onnx_box_thresh", 0.6)),
+        )
+    return EasyOCRBackend(lang)
+
+# --- SHARED API RATE BUDGET ---
+class RateLimiter:
+    """Spaces requests so that all processors together stay under `rpm` requests/minute."""
+    def __init__(self, rpm=0):
+        self.rpm = rpm
+        self.lock = threading.Lock()
+        self.next_slot = 0
+
+    def acquire(self):
+        if not self.rpm: return
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + 60.0 / self.rpm
+        if slot > now: time.sleep(slot - now)
+
+RATE_LIMITER = RateLimiter()
+
+# --- DECODED FRAME MEMORY BUDGET ---
+MB = 1024 * 1024
+
+class FrameBudget:
+    """Byte-weighted semaphore shared by every thread that decodes frames (batch
+    fan-out, prefetch, packed requests, OCR). A decode waits until its estimated
+    pixel memory fits under `limit`; one frame bigger than the whole budget still
+    runs, alone. Above `ceiling_mb` of process RSS, decodes run one at a time.
+
+    Reservations may nest: a thread that already holds one is counted but never
+    waits for more (it would wait on itself and deadlock)."""
+    def __init__(self, limit=0, ceiling_mb=0):
+        self.limit = limit
+        self.ceiling_mb = ceiling_mb
+        self.used = 0
+        self.peak = 0
+        self.cond = threading.Condition()
+        self.local = threading.local()  # per-thread nesting depth
+
+    def _must_wait(self, nbytes):
+        if not self.used: return False
+        if self.limit and self.used + nbytes > self.limit: return True
+        return bool(self.ceiling_mb) and (current_rss_mb() or 0) > self.ceiling_mb
+
+    @contextmanager
+    def reserve(self, nbytes):
+        depth = getattr(self.local, "depth", 0)
+        with self.cond:
+            # RSS is not signalled, so poll while over the ceiling
+            while not depth and self._must_wait(nbytes): self.cond.wait(0.5)
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+        self.local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self.local.depth = depth
+            with self.cond:
+                self.used -= nbytes
+                self.cond.notify_all()
+
+FRAME_BUDGET = FrameBudget()
+
+def frame_bytes(size, copies=1):
+    """Decoded size of an 8-bit RGB frame (times `copies`)."""
+    return size[0] * size[1] * 3 * copies
+
+def still_bytes(path, copies=1):
+    """Decoded size of an image file, read from its header only."""
+    try:
+        with Image.open(path) as img: return frame_bytes(img.size, copies)
+    except: return 0
+
+def current_rss_mb():
+    """Resident memory of this process right now (None when it can't be read)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / MB
+    except ImportError: pass
+    try:
+        with open("/proc/self/statm") as f: return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / MB
+    except: return None
+
+def peak_rss_mb():
+    """Peak resident memory over the whole process lifetime."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS bytes
+        return peak / MB if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, "peak_wset", info.rss) / MB
+        except ImportError:
+            return None
+
+class MemoryMonitor:
+    """Samples RSS in the background between start() and stop() to get the peak of
+    one run (analysis, generation, a queued job). Inside Resolve the process peak
+    would include everything Resolve did before, so it's only the fallback."""
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.peak = None
+        self.frames_peak = 0
+
+    def start(self):
+        self.stop()
+        self.peak = current_rss_mb()
+        with FRAME_BUDGET.cond: FRAME_BUDGET.peak = FRAME_BUDGET.used
+        if self.peak is None: return
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def _sample(self):
+        while not self.stop_event.wait(self.interval):
+            rss = current_rss_mb()
+            if rss is not None: self.peak = max(self.peak, rss)
+
+    def stop(self):
+        """Returns (peak RSS MB or None, peak decoded-frame MB)."""
+        if self.thread:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+            rss = current_rss_mb()
+            if rss is not None: self.peak = max(self.peak, rss)
+        elif self.peak is None:
+            self.peak = peak_rss_mb()
+        self.frames_peak = FRAME_BUDGET.peak / MB
+        return self.peak, self.frames_peak
+
+    def summary(self):
+        rss = f"{self.peak:.0f} MB" if self.peak else "n/a"
+        return f"Peak RSS {rss}, decoded frames {self.frames_peak:.0f}/{FRAME_BUDGET.limit / MB:.0f} MB"
+
+def safe_name(raw):
+    """Folder-safe version of a timeline name (as used for the work dirs)."""
+    return "".join([c for c in raw if c.isalnum() or c in (' ', '-', '_')]).strip()
+
+def work_dir_name(project_name, timeline_name):
+    """Work dir of a timeline: project + timeline, since every project starts with a "Timeline 1"."""
+    if not project_name: return safe_name(timeline_name)
+    return f"{safe_name(project_name)} - {safe_name(timeline_name)}"
+
+# --- CONTENT-ADDRESSED WORK STORE ---
+class WorkStore:
+    """Content-addressed storage for the per-timeline work folders.
+
+    Every still and result is kept once in STORE/blobs/<sha256>; the usual
+    EXP_STILLS / RECEIVED folders hold hard links to those blobs, so duplicate
+    timelines share their data. A manifest per timeline lists its files, which
+    replaces directory scans, and records when it was last used for garbage
+    collection. Without hard-link support files simply stay plain copies.
+    """
+    def __init__(self, base_dir, work_dir, timeline, project=""):
+        self.base_dir = Path(base_dir)
+        self.blob_dir = self.base_dir / "STORE" / "blobs"
+        self.work_dir = Path(work_dir)
+        self.temp_dir = self.work_dir / "TEMP"
+        self.manifest_path = self.work_dir / "manifest.json"
+        self.lock = threading.Lock()
+        self.responses_path = self.base_dir / "STORE" / "responses.json"
+        self.responses = {}
+        self.responses_stamp = None
+        self.manifest = self._load(timeline, project)
+
+    def _load(self, timeline, project):
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f: manifest = json.load(f)
+                if "sizes" not in manifest:
+                    # Written before sizes were recorded: fill them in once
+                    manifest["sizes"] = {rel: (self.temp_dir / rel).stat().st_size
+                                         for rel in manifest.get("files", {}) if (self.temp_dir / rel).exists()}
+                    self.manifest = manifest
+                    self._save()
+                return manifest
+            except: pass
+        manifest = {"timeline": timeline, "project": project, "last_used": time.time(), "files": {}, "sizes": {}, "pinned": []}
+        # First run on an existing work dir: adopt what is already there
+        if self.temp_dir.exists():
+            self.manifest = manifest
+            for kind in ("EXP_STILLS", "RECEIVED"):
+                for p in (self.temp_dir / kind).rglob("*.jpg"): self._add(p)
+            self._save()
+        return manifest
+
+    def _save(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.manifest_path, json.dumps(self.manifest, indent=1).encode('utf-8'))
+
+    def _blob_path(self, digest, suffix):
+        return self.blob_dir / digest[:2] / f"{digest}{suffix.lower()}"
+
+    def _add(self, path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''): h.update(chunk)
+        digest = h.hexdigest()
+        blob = self._blob_path(digest, path.suffix)
+        try:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            if not blob.exists():
+                os.link(path, blob)
+            elif not os.path.samefile(blob, path):
+                # Same content already stored: point this file at the shared blob
+                tmp = path.with_name(f".{path.name}.lnk")
+                os.link(blob, tmp)
+                os.replace(tmp, path)
+        except OSError: pass
+        rel = path.relative_to(self.temp_dir).as_posix()
+        self.manifest["files"][rel] = digest
+        self.manifest.setdefault("sizes", {})[rel] = path.stat().st_size
+
+    def add(self, path):
+        with self.lock:
+            self._add(Path(path))
+            self._save()
+
+    def add_all(self, folder, pattern="*.jpg"):
+        with self.lock:
+            for p in Path(folder).glob(pattern):
+                if p.relative_to(self.temp_dir).as_posix() not in self.manifest["files"]: self._add(p)
+            self._save()
+
+    def list(self, folder, pattern="*.jpg"):
+        """Manifest lookup standing in for Path(folder).glob(pattern)."""
+        prefix = Path(folder).relative_to(self.temp_dir).as_posix() + "/"
+        with self.lock:
+            rels = [r for r in self.manifest["files"] if r.startswith(prefix) and "/" not in r[len(prefix):]]
+        paths = [self.temp_dir / r for r in sorted(rels) if fnmatch.fnmatch(r[len(prefix):], pattern)]
+        return [p for p in paths if p.exists()]
+
+    def pin(self, paths):
+        """Marks outputs imported into a project: cleanup never deletes them."""
+        with self.lock:
+            pinned = set(self.manifest.setdefault("pinned", []))
+            for p in paths:
+                try: pinned.add(Path(p).relative_to(self.temp_dir).as_posix())
+                except ValueError: pass
+            self.manifest["pinned"] = sorted(pinned)
+            self._save()
+
+    def touch(self):
+        with self.lock:
+            self.manifest["last_used"] = time.time()
+            self._save()
+
+    def digest_of(self, path):
+        """Content hash of a stored file, straight from the manifest."""
+        try: rel = Path(path).relative_to(self.temp_dir).as_posix()
+        except ValueError: return None
+        with self.lock:
+            return self.manifest["files"].get(rel)
+
+    # --- RESPONSE CACHE (shared by every timeline) ---
+    def response_key(self, model, prompt, input_digest):
+        return hashlib.sha256(f"{model}\n{prompt}\n{input_digest}".encode('utf-8')).hexdigest()
+
+    def _responses(self):
+        """The response map, parsed again only when the file changed (other jobs write it too)."""
+        try: st = self.responses_path.stat()
+        except OSError: return {}
+        if (st.st_mtime_ns, st.st_size) != self.responses_stamp:
+            try:
+                with open(self.responses_path, 'r', encoding='utf-8') as f: self.responses = json.load(f)
+            except: return {}
+            self.responses_stamp = (st.st_mtime_ns, st.st_size)
+        return self.responses
+
+    def cached_response(self, key):
+        """Returns the stored blob for a previous identical request, or None."""
+        with self.lock:
+            digest = self._responses().get(key)
+        if not digest: return None
+        blob = self._blob_path(digest, ".jpg")
+        return blob if blob.exists() else None
+
+    def remember_response(self, key, output_path):
+        digest = self.digest_of(output_path)
+        if not digest: return
+        with self.lock:
+            responses = dict(self._responses())
+            responses[key] = digest
+            self.responses_path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.responses_path, json.dumps(responses).encode('utf-8'))
+            st = self.responses_path.stat()
+            self.responses, self.responses_stamp = responses, (st.st_mtime_ns, st.st_size)
+
+    def restore(self, blob, dest):
+        """Places a stored blob at `dest` (hard link, or copy) and records it."""
+        dest = Path(dest)
+        tmp = dest.with_name(f".{dest.name}.lnk")
+        try: os.link(blob, tmp)
+        except OSError: shutil.copy2(blob, tmp)
+        os.replace(tmp, dest)
+        self.add(dest)
+
+    def _manifests(self):
+        """Every work dir's manifest, keyed by work dir (the current one live)."""
+        manifests = {}
+        for manifest_path in self.base_dir.glob("*/manifest.json"):
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f: manifests[manifest_path.parent] = json.load(f)
+            except: continue
+        manifests[self.work_dir] = {"files": dict(self.manifest["files"]), "sizes": dict(self.manifest.get("sizes", {}))}
+        return manifests
+
+    def _usage(self, manifests):
+        """Bytes recorded in the manifests, counting shared blobs once. Sizes missing
+        from a manifest are read from the blob."""
+        sizes = {}
+        for manifest in manifests:
+            recorded = manifest.get("sizes", {})
+            for rel, digest in manifest.get("files", {}).items():
+                if digest in sizes: continue
+                size = recorded.get(rel)
+                if size is None:
+                    try: size = self._blob_path(digest, Path(rel).suffix).stat().st_size
+                    except OSError: size = 0
+                sizes[digest] = size
+        return sum(sizes.values())
+
+    def disk_usage(self):
+        """Bytes used by the stored stills and results, from the manifests (no tree walk)."""
+        with self.lock:
+            return self._usage(self._manifests().values())
+
+    def prune_blobs(self):
+        """Deletes blobs no work folder links to any more."""
+        removed = 0
+        if not self.blob_dir.exists(): return 0
+        for blob in self.blob_dir.rglob("*"):
+            try:
+                if blob.is_file() and blob.stat().st_nlink <= 1:
+                    blob.unlink()
+                    removed += 1
+            except OSError: pass
+        return removed
+
+    def _evict(self, work_dir, manifest):
+        """Deletes everything in a work dir that can be regenerated. Pinned (imported)
+        outputs stay, and so does the dir when any are left. Manifests written before
+        pinning existed keep all of RECEIVED, since what was imported is unknown."""
+        pinned = manifest.get("pinned")
+        if pinned is None: pinned = [r for r in manifest.get("files", {}) if r.startswith("RECEIVED/")]
+        temp_dir = work_dir / "TEMP"
+        keep = {rel for rel in pinned if (temp_dir / rel).exists()}
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            manifest["files"], manifest["sizes"] = {}, {}
+            return
+        for root, _, files in os.walk(work_dir):
+            for name in files:
+                path = Path(root) / name
+                if path.parent == work_dir and name == "manifest.json": continue
+                try: rel = path.relative_to(temp_dir).as_posix()
+                except ValueError: rel = None
+                if rel in keep: continue
+                try: path.unlink()
+                except OSError: pass
+        manifest["files"] = {rel: d for rel, d in manifest.get("files", {}).items() if rel in keep}
+        manifest["sizes"] = {rel: n for rel, n in manifest.get("sizes", {}).items() if rel in keep}
+        manifest["pinned"] = sorted(keep)
+        atomic_write(work_dir / "manifest.json", json.dumps(manifest, indent=1).encode('utf-8'))
+
+    def collect(self, budget_bytes, max_age=0, protected_timelines=(), protected_paths=()):
+        """Cleans timeline work dirs, least recently used first, while over budget or
+        older than `max_age` seconds (see _evict: imported outputs are never deleted).
+        The current timeline, `protected_timelines` ((project, timeline) pairs, as in the
+        manifests) and any work dir holding a file used in the media pool are left alone."""
+        protected_paths = [str(p) for p in protected_paths]
+        with self.lock: manifests = self._manifests()
+        candidates = []
+        for work_dir, manifest in manifests.items():
+            if work_dir == self.work_dir: continue
+            if (manifest.get("project", ""), manifest.get("timeline")) in protected_timelines: continue
+            if any(p.startswith(str(work_dir) + os.sep) for p in protected_paths): continue
+            candidates.append((manifest.get("last_used", 0), work_dir, manifest))
+
+        usage = self._usage(manifests.values())
+        now = time.time()
+        evicted = []
+        for last_used, work_dir, manifest in sorted(candidates, key=lambda c: c[0]):
+            too_old = max_age and now - last_used > max_age
+            if not too_old and usage <= budget_bytes: break
+            print(f"Evicting work dir: {work_dir.name}")
+            self._evict(work_dir, manifest)
+            usage = self._usage(manifests.values())
+            evicted.append(work_dir.name)
+        if evicted: self.prune_blobs()
+        return evicted, usage
+
+# --- SPECULATIVE PREFETCH ---
+class ClipPrefetcher:
+    """Generates Instant results ahead of time for the clip under the playhead
+    and the next few clips that have text.
+
+    `update()` must be called from the UI thread (it talks to Resolve); only
+    the Gemini requests run on the worker pool. Jobs that are still queued
+    when the playhead moves away are simply dropped (nothing was sent), and
+    answers for requests already in flight are kept, so no clip is ever paid
+    for twice. The prefetcher outlives its processor: Analyze or toggling the
+    checkbox pauses it and hands it to the next one (`rebind`), so the spend
+    counter is per session and paid results are never requested again.
+    """
+    def __init__(self, proc, clips_ahead=2, max_in_flight=2, max_requests=20, dwell=1.5):
+        self.proc = proc
+        self.clips_ahead = clips_ahead
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_requests = max_requests
+        self.dwell = dwell
+        self.pool = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self.lock = threading.Lock()
+        self.queue = []     # heap of (priority, seq, key)
+        self.jobs = {}      # key -> job (queued or in flight)
+        self.results = {}   # key -> {"bytes", "rec_frame", "duration"}
+        self.done = set()   # keys already imported or failed: never requested again
+        self.in_flight = 0
+        self.spent = 0
+        self.seq = 0
+        self.prompt = None
+        self.paused = False
+        self.timeline = str(proc.work_dir)
+        self.current_clip = None
+        self.clip_since = 0
+        self.map_mtime = None
+        self.map_clips = []
+        self.clip_count = None
+        self.spans = []     # [(start, end, still_or_None)] of every V1 clip
+        self._refresh_clips()
+
+    def _refresh_clips(self):
+        """Re-reads the clips-with-text map whenever Analyze (re)writes it, and the V1 clip
+        spans when the number of clips changes: a tick costs one track listing instead of
+        GetStart/GetEnd on every clip."""
+        try: mtime = (self.proc.paths["JSON"], self.proc.paths["JSON"].stat().st_mtime)
+        except OSError: mtime = None
+        items = self.proc.tl.GetItemListInTrack("video", 1) or []
+        if mtime == self.map_mtime and len(items) == self.clip_count: return
+        if mtime != self.map_mtime:
+            self.map_mtime = mtime
+            self.map_clips = self.proc.get_map_frames()
+        self.clip_count = len(items)
+        self.spans = self.proc.clip_spans(self.map_clips, items)
+
+    def _key(self, clip_start, prompt=None):
+        return (self.timeline, clip_start, prompt if prompt is not None else self.prompt)
+
+    def rebind(self, proc):
+        """Moves the session to a new processor. Spend carries over; ready results only
+        while it is still the same timeline (keys include the work dir)."""
+        with self.lock:
+            self.proc = proc
+            self.timeline = str(proc.work_dir)
+            self.results = {k: r for k, r in self.results.items() if k[0] == self.timeline}
+            self.current_clip = None
+            self.map_mtime = None
+            self.clip_count = None
+
+    def pause(self):
+        """Drops the jobs that were never sent; in-flight answers still land in `results`."""
+        with self.lock:
+            self.paused = True
+            self.queue = []
+            for k in [k for k, j in self.jobs.items() if not j.get("sent")]: self.jobs.pop(k)
+
+    def resume(self):
+        with self.lock: self.paused = False
+
+    def update(self, prompt):
+        self.prompt = prompt
+        self._refresh_clips()
+        item = self.proc.tl.GetCurrentVideoItem()
+        if not item: return
+        start, end = item.GetStart(), item.GetEnd()
+        now = time.time()
+        if start != self.current_clip:
+            self.current_clip, self.clip_since = start, now
+
+        wanted = {}
+        for rank, (c_start, c_end, still) in enumerate(self.proc.get_upcoming_clips(start, self.clips_ahead, self.spans)):
+            if still: wanted[self._key(c_start)] = (rank, c_start, c_end, still)
+
+        key = self._key(start)
+        with self.lock:
+            known = key in self.jobs or key in self.results or key in self.done
+            spent = self.spent >= self.max_requests
+        # Current clip has no analysed still: pre-grab it once the playhead rests on it
+        # (not once the budget is spent: the still would never be sent)
+        if key not in wanted and not known and not spent and now - self.clip_since >= self.dwell:
+            still = self.proc.export_current_still()
+            if still: wanted[key] = (0, start, end, still)
+
+        with self.lock:
+            # Queued jobs that fell out of the window were never sent: drop them
+            kept = [(wanted[k][0], seq, k) for _, seq, k in self.queue if k in wanted]
+            for _, _, k in self.queue:
+                if k not in wanted: self.jobs.pop(k, None)
+            self.queue = kept
+            heapq.heapify(self.queue)
+            for k, (rank, c_start, c_end, still) in wanted.items():
+                if k in self.jobs or k in self.results or k in self.done: continue
+                self.jobs[k] = {"still": still, "rec_frame": c_start, "duration": c_end - c_start, "prompt": k[2], "event": threading.Event()}
+                self.seq += 1
+                heapq.heappush(self.queue, (rank, self.seq, k))
+        self._dispatch()
+
+    def _dispatch(self):
+        with self.lock:
+            while not self.paused and self.queue and self.in_flight < self.max_in_flight and self.spent < self.max_requests:
+                _, _, k = heapq.heappop(self.queue)
+                job = self.jobs.get(k)
+                if not job or job.get("sent"): continue
+                job["sent"] = True
+                self.in_flight += 1
+                self.spent += 1
+                self.pool.submit(self._run, k, job)
+
+    def _run(self, key, job):
+        data = None
+        try:
+            still = job["still"]
+            if isinstance(still, tuple):
+                # Pre-grabbed still: (folder, pattern) still being written by Resolve
+                with FileReadyWatcher(still[0]) as watcher:
+                    still = watcher.wait(still[1], timeout=10)
+            if still:
+                data = self.proc.generate_single(still, Path(still).read_bytes(), job["prompt"])
+        except Exception as e:
+            print(f"Prefetch Error {key[1]}: {e}")
+        with self.lock:
+            self.in_flight -= 1
+            self.jobs.pop(key, None)
+            if data:
+                self.results[key] = {"bytes": data, "rec_frame": job["rec_frame"], "duration": job["duration"]}
+            else:
+                self.done.add(key)
+        job["event"].set()
+        self._dispatch()
+
+    def take(self, clip_start, prompt, timeout=120):
+        """Returns the prefetched result for a clip, waiting if it is in flight."""
+        key = self._key(clip_start, prompt)
+        with self.lock:
+            self.done.add(key)
+            if key in self.results: return self.results.pop(key)
+            job = self.jobs.get(key)
+            if job and not job.get("sent"):
+                # Not sent yet: let the caller do it, never send it twice
+                self.jobs.pop(key, None)
+                self.queue = [q for q in self.queue if q[2] != key]
+                heapq.heapify(self.queue)
+                return None
+        if not job: return None
+        job["event"].wait(timeout)
+        with self.lock:
+            return self.results.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {"spent": self.spent, "in_flight": self.in_flight, "queued": len(self.queue), "ready": len(self.results)}
+
+    def shutdown(self):
+        self.pause()
+        self.pool.shutdown(wait=False)
+
 class GeminiProcessor:
-    def __init__(self, resolve, project, api_key):
+    def __init__(self, resolve, project, api_key, settings=None):
         self.resolve = resolve
         self.project = project
         self.api_key = api_key
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
         self.client = None
         self.reader = None 
+        self.prefetcher = None
+        self.imported = set()   # "<lang>/GEMINI_*.jpg" names appended to the timeline this session
+        self.languages = list(self.settings["target_languages"])
+        self.ocr_lock = threading.Lock()
+        self.box_cache = {}     # still name -> [(bbox, confidence)] for local inpainting
+        self.cache_hits = 0
+        self.requests_sent = 0
+        self.transfer_saved = 0 # upload bytes saved by downscaling, this session
+        RATE_LIMITER.rpm = float(self.settings["rate_limit_rpm"])
+        FRAME_BUDGET.limit = int(float(self.settings["frame_memory_mb"]) * MB)
+        FRAME_BUDGET.ceiling_mb = float(self.settings["rss_ceiling_mb"])
+        if FRAME_BUDGET.ceiling_mb and current_rss_mb() is None:
+            print("⚠️ rss_ceiling_mb is set but memory use can't be read (install psutil): the ceiling is ignored.")
+        self.memory = MemoryMonitor()
         
         if api_key:
             try:
@@ -33,10 +1035,16 @@ class GeminiProcessor:
         # Setup paths
         self.tl = self.project.GetCurrentTimeline()
         raw_name = self.tl.GetName() if self.tl else "Untitled"
-        self.tl_name = "".join([c for c in raw_name if c.isalnum() or c in (' ', '-', '_')]).strip()
+        self.tl_size = None
+        self.refresh_timeline_size()
+        self.tl_name = safe_name(raw_name)
+        try: project_name = self.project.GetName()
+        except: project_name = ""
+        self.project_name = project_name
         
         self.base_dir = Path.home() / "Documents" / "Monkey Translator"
-        self.work_dir = self.base_dir / self.tl_name
+        self.work_dir = self.base_dir / work_dir_name(project_name, raw_name)
+        self._adopt_legacy_work_dir()
         
         self.paths = {
             "ROOT": self.work_dir,
@@ -47,28 +1055,83 @@ class GeminiProcessor:
             "RECEIVED": self.work_dir / "TEMP" / "RECEIVED",
             "JSON": self.work_dir / "TEMP" / f"{self.tl_name}.json",
             "JSON_SINGLE": self.work_dir / "TEMP" / "single_map.json",
-            "OCR_CACHE": self.work_dir / "TEMP" / "ocr_cache.json"
+            "OCR_CACHE": self.work_dir / "TEMP" / "ocr_cache.json",
+            "TEXT_SIZES": self.work_dir / "TEMP" / "text_sizes.json"
         }
         
         self.ocr_cache = {}
+        self.text_px = {}       # still name -> height (px) of its smallest text box
         self.load_cache()
 
+        self.store = WorkStore(self.base_dir, self.work_dir, self.tl_name, project_name)
+
+    def _adopt_legacy_work_dir(self):
+        """Older versions keyed work dirs by timeline name only: take ours over (when its
+        manifest says it belongs to this project) instead of starting from scratch."""
+        legacy = self.base_dir / self.tl_name
+        if self.work_dir.exists() or legacy == self.work_dir or not (legacy / "manifest.json").exists(): return
+        try:
+            with open(legacy / "manifest.json", 'r', encoding='utf-8') as f: manifest = json.load(f)
+            if manifest.get("project") == self.project_name: legacy.rename(self.work_dir)
+        except: pass
+
     def ensure_structure(self):
         for p in self.paths.values():
             if p.suffix in ['.json']: p.parent.mkdir(parents=True, exist_ok=True)
             else: p.mkdir(parents=True, exist_ok=True)
+        self.store.touch()
+        self.collect_garbage()
         return True
 
+    def collect_garbage(self):
+        """Keeps the work dirs within the configured disk budget (see WorkStore.collect)."""
+        protected_timelines = set()
+        protected_paths = []
+        try:
+            for i in range(1, int(self.project.GetTimelineCount()) + 1):
+                tl = self.project.GetTimelineByIndex(i)
+                if tl: protected_timelines.add((self.project_name, safe_name(tl.GetName())))
+            media_pool = self.project.GetMediaPool()
+            folders = [media_pool.GetRootFolder()]
+            while folders:
+                folder = folders.pop()
+                folders += folder.GetSubFolderList() or []
+                for clip in folder.GetClipList() or []:
+                    path = clip.GetClipProperty("File Path")
+                    if path and str(self.base_dir) in path: protected_paths.append(path)
+        except Exception as e:
+            # Can't tell what is in use: don't evict anything
+            print(f"Skipping cleanup: {e}")
+            return [], None
+
+        budget = float(self.settings["store_budget_gb"]) * 1024 ** 3
+        max_age = float(self.settings["store_max_age_days"]) * 86400
+        return self.store.collect(budget, max_age, protected_timelines, protected_paths)
+
+    def _write_output(self, lang, save_name, data):
+        """Writes a generated image into RECEIVED(/<lang>) and records it in the store."""
+        save_path = self.received_dir(lang) / save_name
+        atomic_write(save_path, data)
+        self.store.add(save_path)
+        return save_path
+
     def load_cache(self):
         if self.paths["OCR_CACHE"].exists():
             try:
                 with open(self.paths["OCR_CACHE"], 'r') as f:
                     self.ocr_cache = json.load(f)
             except: pass
+        if self.paths["TEXT_SIZES"].exists():
+            try:
+                with open(self.paths["TEXT_SIZES"], 'r') as f:
+                    self.text_px = json.load(f)
+            except: pass
 
     def save_cache(self):
         with open(self.paths["OCR_CACHE"], 'w') as f:
             json.dump(self.ocr_cache, f)
+        with open(self.paths["TEXT_SIZES"], 'w') as f:
+            json.dump(self.text_px, f)
 
     def _get_or_create_album(self, gallery, album_name):
         albums = gallery.GetGalleryStillAlbums()
@@ -80,17 +1143,50 @@ class GeminiProcessor:
         gallery.SetAlbumName(new_album, album_name)
         return new_album
 
+    def _get_sub_bin(self, media_pool, parent, name):
+        for f in parent.GetSubFolderList():
+            if f.GetName() == name: return f
+        return media_pool.AddSubFolder(parent, name)
+
+    def _get_target_bin(self, media_pool, lang=None):
+        """Finds or creates the FROM_GEMINI bin (FROM_GEMINI/<lang> per language) and makes it current."""
+        target_bin = self._get_sub_bin(media_pool, media_pool.GetRootFolder(), "FROM_GEMINI")
+        if lang: target_bin = self._get_sub_bin(media_pool, target_bin, lang)
+        media_pool.SetCurrentFolder(target_bin)
+        return target_bin
+
+    # --- LANGUAGE HELPERS ---
+    def received_dir(self, lang=None):
+        """Output folder for generated images: RECEIVED, or RECEIVED/<lang> for multi-language jobs."""
+        folder = self.paths["RECEIVED"] / lang if lang else self.paths["RECEIVED"]
+        folder.mkdir(parents=True, exist_ok=True)
+        return folder
+
+    def output_languages(self):
+        """Languages of the current job; [None] means the classic single-language layout."""
+        return list(self.languages) or [None]
+
+    def track_for(self, lang=None):
+        """V2 for single-language jobs, then one track per target language (V2, V3, ...)."""
+        return 2 + (self.languages.index(lang) if lang in self.languages else 0)
+
     # --- TRACK HELPER (NEW) ---
     def _ensure_track_2_exists(self):
         """Checks if V2 exists, creates it if not."""
-        track_count = self.tl.GetTrackCount("video")
-        if track_count < 2:
-            print("Creating Video Track 2...")
-            self.tl.AddTrack("video")
+        self._ensure_track_exists(2)
+
+    def _ensure_track_exists(self, index, name=None):
+        """Adds video tracks until `index` exists, optionally naming it."""
+        while self.tl.GetTrackCount("video") < index:
+            print(f"Creating Video Track {self.tl.GetTrackCount('video') + 1}...")
+            if not self.tl.AddTrack("video"): break
+        if name:
+            try: self.tl.SetTrackName("video", index, name)
+            except: pass
 
     # --- BATCH WORKFLOW ---
     def grab_stills(self):
-        existing_jpgs = list(self.paths["EXP_STILLS"].glob("*.jpg"))
+        existing_jpgs = self.store.list(self.paths["EXP_STILLS"])
         if len(existing_jpgs) > 0:
             return True, f"Skipped export. Using {len(existing_jpgs)} existing stills."
 
@@ -104,6 +1200,7 @@ class GeminiProcessor:
         if not stills: return False, "No stills found."
             
         album.ExportStills(stills, str(self.paths["EXP_STILLS"]), self.tl_name, "jpg")
+        self.store.add_all(self.paths["EXP_STILLS"])
         return True, f"Exported {len(stills)} stills."
 
     def process_drx(self):
@@ -124,6 +1221,24 @@ class GeminiProcessor:
 
     # --- SINGLE CLIP WORKFLOW ---
     def run_single_clip_workflow(self, prompt):
+        # Instant mode: the exported frame and Gemini's answer stay in memory,
+        # the only write is the final file that ImportMedia needs.
+        timer = PhaseTimer()
+        self.last_timings = timer
+        self.refresh_timeline_size()
+
+        self.paths["RECEIVED"].mkdir(parents=True, exist_ok=True)
+
+        # 0. PREFETCHED RESULT FOR THE CLIP UNDER THE PLAYHEAD?
+        if self.prefetcher:
+            video_item = self.tl.GetCurrentVideoItem()
+            hit = self.prefetcher.take(video_item.GetStart(), prompt) if video_item else None
+            if hit:
+                timer.mark("prefetch")
+                save_path = self._write_output(None, f"GEMINI_Single_{int(time.time())}.jpg", hit["bytes"])
+                timer.mark("write")
+                return self._import_single(save_path, hit["rec_frame"], int(hit["duration"]), timer)
+
         # 1. SETUP & GRAB
         single_dir = self.paths["EXP_STILLS_SINGLES"]
         single_dir.mkdir(parents=True, exist_ok=True)
@@ -135,30 +1250,26 @@ class GeminiProcessor:
         print("Grabbing Single Still...")
         current_still = self.tl.GrabStill()
         if not current_still: return False, "Could not grab still."
+        timer.mark("grab")
 
         base_name = f"Single_{int(time.time())}"
         
-        if not album.ExportStills([current_still], str(single_dir), base_name, "jpg"):
-            return False, "Export failed."
-        
-        # Wait for file
-        timeout = 10 
-        start_time = time.time()
-        jpg_path = None
-        
-        print(f"Waiting for export: {base_name}...")
-        while time.time() - start_time < timeout:
-            candidates = list(single_dir.glob(f"{base_name}*.jpg"))
-            if candidates:
-                jpg_path = candidates[0] 
-                time.sleep(0.5) 
-                break
-            time.sleep(0.5)
-            
-        if not jpg_path: return False, "Timeout: File not created."
+        # Wait for file (watcher is armed before the export so no event is missed)
+        with FileReadyWatcher(single_dir) as watcher:
+            if not album.ExportStills([current_still], str(single_dir), base_name, "jpg"):
+                return False, "Export failed."
+
+            print(f"Waiting for export: {base_name}...")
+            jpg_path = watcher.wait(f"{base_name}*.jpg", timeout=10)
+            if not jpg_path: return False, "Timeout: File not created."
+
+            drx_path = jpg_path.with_suffix(".drx")
+            if not drx_path.exists():
+                drx_path = watcher.wait(drx_path.name, timeout=1) or drx_path
 
         print(f"Detected file: {jpg_path.name}")
-        drx_path = jpg_path.with_suffix(".drx")
+        still_data = jpg_path.read_bytes()
+        timer.mark("export")
 
         # 2. PROCESS DRX
         rec_tc = "00:00:00:00"
@@ -168,7 +1279,6 @@ class GeminiProcessor:
             try:
                 raw_text = drx_path.read_text(encoding='utf-8')
                 clean_text = raw_text.replace('::', '')
-                drx_path.write_text(clean_text, encoding='utf-8')
                 
                 import re
                 match = re.search(r'RecTC="([^"]+)"', clean_text)
@@ -179,73 +1289,48 @@ class GeminiProcessor:
                     video_item = self.tl.GetCurrentVideoItem()
                     if video_item: duration = str(video_item.GetDuration())
             except: pass
+        timer.mark("drx")
 
-        # 3. SEND TO GEMINI (4K)
-        print(f"Sending {jpg_path.name} to Gemini (4K)...")
-        if not self.client: return False, "API Key missing."
+        # 3. GENERATE (Gemini output size negotiated from the timeline resolution, or local)
+        local = self.settings["generation_backend"] == "local_inpaint"
+        print(f"Processing {jpg_path.name} ({'local' if local else self.pick_output_size()})...")
+        if not self.client and not local: return False, "API Key missing."
         
+        save_name = f"GEMINI_{base_name}.jpg"
+        save_path = self.paths["RECEIVED"] / save_name
         try:
-            img = Image.open(jpg_path)
-            response = self.client.models.generate_content(
-                model="gemini-3-pro-image-preview", 
-                contents=[prompt, img],
-                config=types.GenerateContentConfig(
-                    response_modalities=["TEXT", "IMAGE"],
-                    image_config=types.ImageConfig(image_size="4K")
-                )
-            )
-            
-            generated = False
-            if response.parts:
-                for part in response.parts:
-                    if part.inline_data:
-                        gen_img = part.as_image()
-                        save_name = f"GEMINI_{base_name}.jpg" 
-                        save_path = self.paths["RECEIVED"] / save_name
-                        
-                        gen_img.save(save_path)
-                        
-                        clean_img = Image.open(save_path)
-                        data = list(clean_img.getdata())
-                        final_img = Image.new(clean_img.mode, clean_img.size)
-                        final_img.putdata(data)
-                        final_img.save(save_path)
-                        generated = True
-                        break 
-            
-            if not generated: return False, "Gemini did not return an image."
+            final_bytes = self.generate_single(jpg_path, still_data, prompt)
+            timer.mark("generate")
+            if not final_bytes: return False, "No image was generated."
+
+            self._write_output(None, save_name, final_bytes)
+            timer.mark("write")
             
         except Exception as e:
-            return False, f"Gemini API Error: {e}"
+            return False, f"Generation Error: {e}"
 
         # 4. IMPORT & APPEND
+        fps = float(self.tl.GetSetting("timelineFrameRate"))
+        return self._import_single(save_path, self._tc_to_frame(rec_tc, fps), int(float(duration)), timer)
+
+    def _import_single(self, save_path, rec_frame, dur_int, timer):
+        save_name = Path(save_path).name
         media_pool = self.project.GetMediaPool()
-        root_folder = media_pool.GetRootFolder()
-        
-        target_bin = None
-        for f in root_folder.GetSubFolderList():
-            if f.GetName() == "FROM_GEMINI": target_bin = f; break
-        if not target_bin: target_bin = media_pool.AddSubFolder(root_folder, "FROM_GEMINI")
-        media_pool.SetCurrentFolder(target_bin)
-        
-        gen_file_path = str(self.paths["RECEIVED"] / f"GEMINI_{base_name}.jpg")
-        media_pool.ImportMedia([gen_file_path])
+        target_bin = self._get_target_bin(media_pool)
         
-        clips = target_bin.GetClipList()
-        target_clip = next((c for c in clips if c.GetName() == f"GEMINI_{base_name}.jpg"), None)
+        imported = media_pool.ImportMedia([str(save_path)])
+        self.store.pin([save_path])
+        target_clip = imported[0] if imported else None
+        if not target_clip:
+            clips = target_bin.GetClipList()
+            target_clip = next((c for c in clips if c.GetName() == save_name), None)
+        timer.mark("import")
         
         if target_clip:
             # --- FIX: ENSURE TRACK 2 EXISTS ---
             self._ensure_track_2_exists()
             # ----------------------------------
 
-            fps = float(self.tl.GetSetting("timelineFrameRate"))
-            try:
-                h, m, s, f = map(int, rec_tc.split(':'))
-                rec_frame = int((h*3600+m*60+s)*fps + f)
-            except: rec_frame = 0
-            
-            dur_int = int(float(duration))
             target_clip.SetMarkInOut(1, dur_int)
             
             media_pool.AppendToTimeline([{
@@ -257,39 +1342,221 @@ class GeminiProcessor:
                 'trackIndex': 2, # Now guaranteed to exist
                 'mediaType': 1 
             }])
+            timer.mark("append")
+            print(f"Latency: {timer.summary()}")
             
-            return True, "Single clip processed (4K) and appended to Track 2."
+            engine = "local" if self.settings["generation_backend"] == "local_inpaint" else self.pick_output_size()
+            return True, f"Single clip processed ({engine}) in {timer.total():.1f}s and appended to Track 2."
         
         return False, "Import failed."
 
-    # --- OCR HELPERS ---
-    def init_ocr(self, lang):
-        if not self.reader:
-            print(f"Loading OCR Model ({lang})...")
-            # SSL Fix for Mac
-            try:
-                _create_unverified_https_context = ssl._create_unverified_context
-            except AttributeError: pass
-            else: ssl._create_default_https_context = _create_unverified_https_context
+    def _generate_content(self, **kwargs):
+        """All Gemini calls go through here so they share the rate budget (and are measured
+        for the planner)."""
+        RATE_LIMITER.acquire()
+        self.requests_sent += 1
+        start = time.perf_counter()
+        response = self.client.models.generate_content(**kwargs)
+        raw = response_image_bytes(response)
+        self.record_throughput(kwargs.get("model", ""), time.perf_counter() - start, len(raw) if raw else 0)
+        return response
+
+    # --- THROUGHPUT HISTORY ---
+    def _throughput_path(self):
+        return self.base_dir / "STORE" / "throughput.json"
+
+    def load_throughput(self):
+        try:
+            with open(self._throughput_path(), 'r', encoding='utf-8') as f: return json.load(f)
+        except: return {}
+
+    def record_throughput(self, model, seconds, response_bytes):
+        """Keeps a moving average of request time and response size per model."""
+        with self.store.lock:
+            stats = self.load_throughput()
+            entry = stats.get(model, {"count": 0, "seconds": seconds, "response_bytes": response_bytes})
+            weight = 0.2 if entry["count"] >= 5 else 1.0 / (entry["count"] + 1)
+            entry["seconds"] += (seconds - entry["seconds"]) * weight
+            if response_bytes: entry["response_bytes"] += (response_bytes - entry["response_bytes"]) * weight
+            entry["count"] += 1
+            stats[model] = entry
+            path = self._throughput_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(path, json.dumps(stats, indent=1).encode('utf-8'))
+
+    def generate_single_image(self, still_data, prompt):
+        """Sends one JPEG frame to Gemini and returns the cleaned JPEG bytes at timeline size, or None."""
+        image_size = self.pick_output_size()
+        # The model can't return more detail than its output size: no need to upload more
+        upload = downscale_jpeg(still_data, dict(OUTPUT_SIZES)[image_size])
+        response = self._generate_content(
+            model="gemini-3-pro-image-preview", 
+            contents=[prompt, types.Part.from_bytes(data=upload, mime_type="image/jpeg")],
+            config=types.GenerateContentConfig(
+                response_modalities=["TEXT", "IMAGE"],
+                image_config=types.ImageConfig(image_size=image_size)
+            )
+        )
+        raw = response_image_bytes(response)
+        self._report_transfer("single", len(still_data), len(upload), image_size)
+        return clean_jpeg_bytes(raw, self.output_dims()) if raw else None
+
+    # --- RESOLUTION NEGOTIATION ---
+    def refresh_timeline_size(self):
+        """Reads the timeline resolution. UI thread only: worker threads (prefetch, language
+        fan-out) use the stored value through timeline_size() and never call Resolve."""
+        try: self.tl_size = (int(self.tl.GetSetting("timelineResolutionWidth")), int(self.tl.GetSetting("timelineResolutionHeight")))
+        except: self.tl_size = None
+        return self.tl_size
+
+    def timeline_size(self):
+        return self.tl_size
+
+    def output_dims(self):
+        """Size results are resampled to (None keeps what Gemini returned)."""
+        return self.timeline_size() if self.settings["resample_to_timeline"] else None
+
+    def pick_output_size(self):
+        """Smallest Gemini image_size whose long edge covers the timeline."""
+        setting = str(self.settings["output_size"]).strip().upper()
+        if setting in dict(OUTPUT_SIZES): return setting
+        if setting != "AUTO": print(f"Unknown output_size {self.settings['output_size']!r}, using auto.")
+        size = self.timeline_size()
+        if not size: return "4K"
+        return next((label for label, edge in OUTPUT_SIZES if edge >= max(size)), "4K")
+
+    def upload_bytes(self, src_path):
+        """Still bytes to send for a batch item: downscaled to upload_max_edge when the
+        smallest text stays at least min_text_px tall, otherwise the original file."""
+        data = src_path.read_bytes()
+        if not self.text_px.get(src_path.name): return data
+        with Image.open(io.BytesIO(data)) as img: long_edge = max(img.size)
+        scale = self.upload_scale(src_path.name, long_edge)
+        if scale >= 0.95: return data
+        return downscale_jpeg(data, long_edge * scale)
+
+    def upload_scale(self, name, long_edge):
+        text_px = self.text_px.get(name)
+        if not text_px: return 1.0
+        return min(1.0, max(float(self.settings["upload_max_edge"]) / long_edge, float(self.settings["min_text_px"]) / text_px))
+
+    def _report_transfer(self, name, original, sent, image_size=None):
+        saved = original - sent
+        msg = f"{name}: upload {sent / 1024:.0f} KB (saved {saved / 1024:.0f} KB)"
+        if image_size:
+            full_px = OUTPUT_SIZES[-1][1]
+            msg += f", output {image_size} ({(1 - (dict(OUTPUT_SIZES)[image_size] / full_px) ** 2) * 100:.0f}% fewer pixels than 4K)"
+        self.transfer_saved += saved
+        print(msg)
 
-            gpu_enable = False
+    # --- PREFETCH HELPERS ---
+    def _tc_to_frame(self, rec_tc, fps):
+        try:
+            h, m, s, f = map(int, rec_tc.split(':'))
+            return int((h*3600+m*60+s)*fps + f)
+        except: return 0
+
+    def get_map_frames(self):
+        """Returns [(rec_frame, still_path)] for every analysed still with text."""
+        fps = float(self.tl.GetSetting("timelineFrameRate"))
+        frames = []
+        for item in self.get_gemini_list():
+            still = self.paths["EXP_STILLS"] / item['name']
+            if still.exists(): frames.append((self._tc_to_frame(item['RecTC'], fps), still))
+        return frames
+
+    def clip_spans(self, map_frames, items=None):
+        """[(start, end, still_or_None)] for every V1 clip in timeline order (calls Resolve)."""
+        if items is None: items = self.tl.GetItemListInTrack("video", 1) or []
+        frames = sorted(map_frames, key=lambda m: m[0])
+        starts = [f for f, _ in frames]
+        spans = []
+        for start, end in sorted((i.GetStart(), i.GetEnd()) for i in items):
+            i = bisect.bisect_left(starts, start)
+            spans.append((start, end, frames[i][1] if i < len(frames) and frames[i][0] < end else None))
+        return spans
+
+    def get_upcoming_clips(self, clip_start, count, spans):
+        """Returns [(start, end, still_or_None)] for the clip at `clip_start` and the next `count` clips with text."""
+        clips = []
+        first = max(0, bisect.bisect_right(spans, (clip_start, math.inf)) - 1)
+        for start, end, still in spans[first:]:
+            if end <= clip_start: continue
+            if start == clip_start or still: clips.append((start, end, still))
+            if len(clips) > count: break
+        return clips
+
+    def export_current_still(self):
+        """Grabs the frame under the playhead and starts exporting it; returns (folder, pattern)."""
+        single_dir = self.paths["EXP_STILLS_SINGLES"]
+        single_dir.mkdir(parents=True, exist_ok=True)
+        gallery = self.project.GetGallery()
+        album = self._get_or_create_album(gallery, "Gemini_Singles")
+        gallery.SetCurrentStillAlbum(album)
+        still = self.tl.GrabStill()
+        if not still: return None
+        base_name = f"Prefetch_{int(time.time() * 1000)}"
+        if not album.ExportStills([still], str(single_dir), base_name, "jpg"): return None
+        return (single_dir, f"{base_name}*.jpg")
+
+    def start_prefetch(self, previous=None):
+        """Starts or resumes prefetch. `previous` is the session's prefetcher from an earlier
+        processor: it is taken over rather than replaced (see ClipPrefetcher)."""
+        self.refresh_timeline_size()
+        if not self.prefetcher and previous:
+            previous.rebind(self)
+            self.prefetcher = previous
+        if not self.prefetcher:
+            self.prefetcher = ClipPrefetcher(
+                self,
+                clips_ahead=int(self.settings["prefetch_clips_ahead"]),
+                max_in_flight=int(self.settings["prefetch_max_in_flight"]),
+                max_requests=int(self.settings["prefetch_max_requests"]),
+            )
+        self.prefetcher.resume()
+        return self.prefetcher
+
+    def stop_prefetch(self):
+        """Pauses prefetch; spend and paid results stay with the prefetcher."""
+        if self.prefetcher: self.prefetcher.pause()
+
+    # --- MEMORY ---
+    def start_run(self):
+        self.refresh_timeline_size()
+        self.memory.start()
+
+    def finish_run(self, drop_ocr=False):
+        """Releases what the finished stage left behind and returns its memory summary.
+        The OCR model is only dropped on request (local inpainting reloads it on demand)."""
+        if drop_ocr: self.reader = None
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None:
             try:
-                import torch
-                if torch.cuda.is_available(): gpu_enable = True
-                elif torch.backends.mps.is_available(): gpu_enable = True
+                if torch.cuda.is_available(): torch.cuda.empty_cache()
             except: pass
+        self.memory.stop()
+        return self.memory.summary()
 
-            self.reader = easyocr.Reader([lang], gpu=gpu_enable)
+    # --- OCR HELPERS ---
+    def init_ocr(self, lang):
+        self.ocr_lang = lang
+        if not self.reader:
+            print(f"Loading OCR Model ({self.settings['ocr_backend']}, {lang})...")
+            self.reader = create_ocr_backend(self.settings, lang)
 
     def get_images_for_ocr(self):
-        return list(self.paths["EXP_STILLS"].glob("*.jpg"))
+        return self.store.list(self.paths["EXP_STILLS"])
 
     def step_ocr(self, img_path):
         if img_path.name in self.ocr_cache:
             return self.ocr_cache[img_path.name], False
         try:
-            result = self.reader.readtext(str(img_path), detail=0, text_threshold=0.85)
-            has_text = bool(result)
+            boxes = self.reader.scan(img_path)
+            has_text = bool(boxes)
+            if boxes:
+                # Smallest text height decides how far the upload can be downscaled
+                self.text_px[img_path.name] = min(max(p[1] for p in b) - min(p[1] for p in b) for b, _ in boxes)
             self.ocr_cache[img_path.name] = has_text
             self.save_cache()
             return has_text, True
@@ -336,37 +1603,35 @@ class GeminiProcessor:
         with open(self.paths["JSON"], 'r', encoding='utf-8') as f:
             return json.load(f)
 
-    def step_gemini(self, item, prompt):
+    def step_gemini(self, item, prompt, lang=None, image=None):
         img_name = item['name']
         src_path = self.paths["EXP_STILLS"] / img_name
-        if not src_path.exists(): return False
+        save_name = f"GEMINI_{Path(img_name).stem}.jpg"
+        model = "gemini-2.5-flash-image"
+
+        # Same still + same prompt already answered (any timeline): reuse it
+        restored, cache_key = self.restore_cached(item, prompt, lang)
+        if restored: return True
+
+        if image is None:
+            if not src_path.exists(): return False
+            data = self.upload_bytes(src_path)
+            self._report_transfer(img_name, src_path.stat().st_size, len(data))
+            image = types.Part.from_bytes(data=data, mime_type="image/jpeg")
 
         try:
-            img = Image.open(src_path)
-            
             # Updated to use Gemini 2.5 Flash based on your documentation
-            response = self.client.models.generate_content(
-                model="gemini-2.5-flash-image",
-                contents=[prompt, img],
+            response = self._generate_content(
+                model=model,
+                contents=[prompt, image],
             )
             
             # Processing the response
-            if response.parts:
-                for part in response.parts:
-                    # Prioritize inline_data (Image)
-                    if part.inline_data:
-                        gen_img = part.as_image()
-                        save_name = f"GEMINI_{Path(img_name).stem}.jpg"
-                        save_path = self.paths["RECEIVED"] / save_name
-                        gen_img.save(save_path)
-                        
-                        # Your existing metadata cleaning logic
-                        clean_img = Image.open(save_path)
-                        data = list(clean_img.getdata())
-                        final_img = Image.new(clean_img.mode, clean_img.size)
-                        final_img.putdata(data)
-                        final_img.save(save_path)
-                        return True
+            raw = response_image_bytes(response)
+            if raw:
+                save_path = self._write_output(lang, save_name, clean_jpeg_bytes(raw, self.output_dims()))
+                if cache_key: self.store.remember_response(cache_key, save_path)
+                return True
                         
             time.sleep(1)
             return False
@@ -374,31 +1639,378 @@ class GeminiProcessor:
             print(f"Gemini Error {img_name}: {e}")
             return False
 
+    def restore_cached(self, item, prompt, lang=None):
+        """Places a cached answer for (still, prompt) in the output folder.
+        Returns (restored, cache key or None when the still isn't in the store)."""
+        src_path = self.paths["EXP_STILLS"] / item['name']
+        input_digest = self.store.digest_of(src_path)
+        if not input_digest: return False, None
+        cache_key = self.store.response_key("gemini-2.5-flash-image", prompt, input_digest)
+        blob = self.store.cached_response(cache_key)
+        if not blob: return False, cache_key
+        self.store.restore(blob, self.received_dir(lang) / f"GEMINI_{Path(item['name']).stem}.jpg")
+        self.cache_hits += 1
+        return True, cache_key
+
+    # --- GENERATION BACKENDS ---
+    def step_generate(self, item, prompt, lang=None, image=None):
+        """Same contract as step_gemini, routed to the configured backend."""
+        if self.settings["generation_backend"] == "local_inpaint":
+            fallback = self.settings["local_fallback_to_gemini"]
+            # With a fallback, a weak local result is never written (it could outlive a failed retry)
+            ok, confident = self.step_local_inpaint(item, lang, keep_weak=not fallback)
+            if ok and confident: return True
+            if not fallback: return ok
+            print(f"Low OCR confidence on {item['name']}, sending to Gemini.")
+        return self.step_gemini(item, prompt, lang, image)
+
+    def _text_boxes(self, src_path, cache=True):
+        with self.ocr_lock:
+            if not self.reader: self.init_ocr(getattr(self, 'ocr_lang', None) or self.settings.get("lang", "es"))
+            if not cache: return self.reader.detect(src_path)
+            if src_path.name not in self.box_cache:
+                self.box_cache[src_path.name] = self.reader.detect(src_path)
+            return self.box_cache[src_path.name]
+
+    def local_inpaint_bytes(self, src_path, data=None, keep_weak=True, cache=True):
+        """Removes text offline: OCR boxes -> mask -> OpenCV inpainting. `data` is the
+        still already in memory (Instant), otherwise it's read from `src_path`.
+        Returns (JPEG bytes or None, confident); `confident` is False when OCR found
+        nothing or a weak box, and with keep_weak=False a weak box gives (None, False)."""
+        if cv2 is None:
+            print("OpenCV is not installed, local inpainting unavailable.")
+            return None, False
+        boxes = self._text_boxes(src_path, cache)
+        if not boxes: return None, False
+        confident = min(conf for _, conf in boxes) >= float(self.settings["inpaint_min_confidence"])
+        if not confident and not keep_weak: return None, False
+
+        # Source, result and two single-channel masks
+        with FRAME_BUDGET.reserve(still_bytes(src_path, copies=3)):
+            if data is None: img = cv2.imread(str(src_path), cv2.IMREAD_COLOR)
+            else: img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            mask = np.zeros(img.shape[:2], dtype=np.uint8)
+            for bbox, _ in boxes:
+                cv2.fillPoly(mask, [np.array(bbox, dtype=np.int32)], 255)
+            # Grow the mask a little to cover anti-aliasing and drop shadows
+            radius = int(self.settings["inpaint_radius"])
+            mask = cv2.dilate(mask, np.ones((radius * 2 + 1, radius * 2 + 1), np.uint8))
+
+            flags = cv2.INPAINT_NS if self.settings["inpaint_method"] == "ns" else cv2.INPAINT_TELEA
+            result = cv2.inpaint(img, mask, radius, flags)
+            ok, encoded = cv2.imencode(".jpg", result, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            del img, mask, result
+        return (encoded.tobytes() if ok else None), confident
+
+    def step_local_inpaint(self, item, lang=None, keep_weak=True):
+        """Batch version of local_inpaint_bytes: writes GEMINI_<stem>.jpg. Returns (ok, confident)."""
+        src_path = self.paths["EXP_STILLS"] / item['name']
+        if not src_path.exists(): return False, False
+        try:
+            data, confident = self.local_inpaint_bytes(src_path, keep_weak=keep_weak)
+            if not data: return False, False
+            self._write_output(lang, f"GEMINI_{Path(item['name']).stem}.jpg", data)
+            return True, confident
+        except Exception as e:
+            print(f"Inpaint Error {item['name']}: {e}")
+            return False, False
+
+    def generate_single(self, still_path, still_data, prompt):
+        """Instant/prefetch counterpart of step_generate: the still comes from memory and
+        the result is returned (JPEG bytes or None), routed to the configured backend."""
+        if self.settings["generation_backend"] == "local_inpaint":
+            fallback = self.settings["local_fallback_to_gemini"]
+            try:
+                data, confident = self.local_inpaint_bytes(Path(still_path), still_data, keep_weak=not fallback, cache=False)
+            except Exception as e:
+                print(f"Inpaint Error {Path(still_path).name}: {e}")
+                data, confident = None, False
+            if data and (confident or not fallback): return data
+            if not fallback: return None
+            print(f"Low OCR confidence on {Path(still_path).name}, sending to Gemini.")
+        return self.generate_single_image(still_data, prompt)
+
+    # --- DRY-RUN PLANNER ---
+    def plan_generation(self, prompts):
+        """Predicts what "Generate" will cost without sending anything.
+        `prompts` maps language (None for single-language) to prompt, as for step_gemini_fanout."""
+        items = self.get_gemini_list()
+        model = "gemini-2.5-flash-image"
+        local = self.settings["generation_backend"] == "local_inpaint"
+        packing = self.settings["pack_enabled"] and not local
+        shared_upload = len(prompts) > 1 and not packing
+        size = self.refresh_timeline_size()  # UI thread
+        long_edge = max(size) if size else 1920
+
+        plan = {"stills": len(items), "languages": len(prompts), "cache_hits": 0, "duplicates": 0,
+                "requests": 0, "local_frames": 0, "upload_bytes": 0, "download_bytes": 0}
+        # Walk the stills in the same packs as the batch loop; cached stills are restored
+        # and left out of their pack (step_gemini_pack), the rest of each pack is one request
+        pack = max(1, int(self.settings["pack_size"])) if packing else 1
+        seen = set()
+        for start in range(0, len(items), pack):
+            group = []
+            for item in items[start:start + pack]:
+                src_path = self.paths["EXP_STILLS"] / item['name']
+                if not src_path.exists(): continue
+                if local:
+                    plan["local_frames"] += 1
+                    continue
+                upload = src_path.stat().st_size * self.upload_scale(item['name'], long_edge) ** 2
+                group.append((self.store.digest_of(src_path), upload))
+
+            sent, uploaded = set(), set()
+            for lang, prompt in prompts.items():
+                members = []
+                for i, (digest, upload) in enumerate(group):
+                    key = self.store.response_key(model, prompt, digest) if digest else None
+                    if key and self.store.cached_response(key):
+                        plan["cache_hits"] += 1
+                    elif key in seen:
+                        # Answered by an earlier pack by the time this one is sent
+                        plan["duplicates"] += 1
+                    else:
+                        members.append((i, upload))
+                        if key: sent.add(key)
+                if not members: continue
+                plan["requests"] += 1
+                if len(members) > 1:
+                    # A contact sheet of downscaled tiles weighs about one still
+                    plan["upload_bytes"] += sum(u for _, u in members) / len(members)
+                else:
+                    i, upload = members[0]
+                    if not (shared_upload and i in uploaded): plan["upload_bytes"] += upload
+                    uploaded.add(i)
+            seen |= sent
+
+        stats = self.load_throughput().get(model, {})
+        seconds = stats.get("seconds", DEFAULT_REQUEST_SECONDS)
+        plan["download_bytes"] = plan["requests"] * stats.get("response_bytes", DEFAULT_RESPONSE_BYTES)
+        plan["measured"] = stats.get("count", 0)
+
+        # Languages run in parallel, stills one after another; the rate limit caps the rest
+        concurrency = max(1, len(prompts))
+        wall = math.ceil(plan["requests"] / concurrency) * seconds
+        rpm = float(self.settings["rate_limit_rpm"])
+        if rpm: wall = max(wall, plan["requests"] * 60.0 / rpm)
+        plan["wall_seconds"] = wall + plan["local_frames"] * 0.2
+        return plan
+
+    def format_plan(self, plan):
+        lines = [f"{plan['stills']} stills with text x {plan['languages']} language(s)"]
+        if plan["local_frames"]:
+            lines.append(f"Local engine: {plan['local_frames']} frames offline (+ any low-confidence fallbacks)")
+        else:
+            lines.append(f"API requests: {plan['requests']}  (cache hits: {plan['cache_hits']}, duplicates: {plan['duplicates']})")
+            lines.append(f"Upload ~{plan['upload_bytes'] / 1048576:.1f} MB, download ~{plan['download_bytes'] / 1048576:.1f} MB")
+        minutes, secs = divmod(int(plan["wall_seconds"]), 60)
+        basis = f"measured over {plan['measured']} requests" if plan.get("measured") else "default estimate"
+        lines.append(f"Estimated time: {minutes} min {secs:02d} s ({basis})")
+        return "\n".join(lines)
+
+    # --- BATCH SCHEDULING ---
+    def get_focus(self):
+        """Returns (playhead_frame, [(start, end)]) for where the editor is working: the
+        playhead plus timeline markers and the In/Out range."""
+        fps = float(self.tl.GetSetting("timelineFrameRate"))
+        playhead = self._tc_to_frame(self.tl.GetCurrentTimecode(), fps)
+        ranges = []
+        try:
+            tl_start = self.tl.GetStartFrame()
+            for frame_id, marker in (self.tl.GetMarkers() or {}).items():
+                start = tl_start + int(frame_id)
+                ranges.append((start, start + max(1, int(marker.get('duration', 1)))))
+            video = (self.tl.GetMarkInOut() or {}).get('video') or {}
+            if 'in' in video and 'out' in video:
+                ranges.append((tl_start + video['in'], tl_start + video['out'] + 1))
+        except: pass
+        return playhead, ranges
+
+    def prioritize(self, queue, start_index=0):
+        """Re-orders the pending part of `queue` (items from the JSON map) so clips inside
+        marked ranges come first, then the rest by distance from the playhead. Cheap enough
+        to call before every step so the order follows the editor live."""
+        if self.settings["batch_order"] != "playhead" or len(queue) - start_index < 2: return
+        fps = float(self.tl.GetSetting("timelineFrameRate"))
+        playhead, ranges = self.get_focus()
+
+        def rank(item):
+            frame = self._tc_to_frame(item['RecTC'], fps)
+            in_range = any(start <= frame < end for start, end in ranges)
+            return (0 if in_range else 1, abs(frame - playhead))
+
+        queue[start_index:] = sorted(queue[start_index:], key=rank)
+
+    # --- PACKED GENERATION ---
+    def next_pack(self, queue, start_index):
+        """Returns the items to send in the next request (one unless packing is on)."""
+        # Local inpainting is per-frame and instant: nothing to amortize
+        packing = self.settings["pack_enabled"] and self.settings["generation_backend"] == "gemini"
+        size = int(self.settings["pack_size"]) if packing else 1
+        return queue[start_index:start_index + max(1, size)]
+
+    def step_gemini_pack(self, items, prompt, lang=None, shared=None):
+        """Generates a group of items, packed into one request when possible.
+        Returns [(item, ok)]; tiles that fail validation are redone one by one."""
+        shared = shared or {}
+        if len(items) < 2: return [(item, self.step_generate(item, prompt, lang, shared.get(item['name']))) for item in items]
+
+        # Cached stills are restored, only the rest goes into the sheet
+        done = {item['name'] for item in items if self.restore_cached(item, prompt, lang)[0]}
+        todo = [item for item in items if item['name'] not in done]
+        if len(todo) < 2:
+            done.update(item['name'] for item in todo if self.step_gemini(item, prompt, lang))
+            return [(item, item['name'] in done) for item in items]
+
+        try:
+            packed = self._generate_packed(todo, prompt, lang)
+        except Exception as e:
+            print(f"Packed Gemini Error: {e}")
+            packed = set()
+        if packed: print(f"Packed request: {len(packed)}/{len(todo)} tiles accepted.")
+        done |= packed
+        return [(item, item['name'] in done or self.step_gemini(item, prompt, lang)) for item in items]
+
+    def step_gemini_fanout(self, items, prompts):
+        """Runs one step for every target language concurrently.
+        `prompts` maps language (None for single-language) to prompt; returns [(item, lang, ok)]."""
+        if len(prompts) == 1:
+            lang, prompt = next(iter(prompts.items()))
+            return [(item, lang, ok) for item, ok in self.step_gemini_pack(items, prompt, lang)]
+
+        # Upload each still once and reference it from every language's request
+        shared = self._upload_shared(items) if len(items) == 1 and self.settings["generation_backend"] == "gemini" else {}
+        results = []
+        try:
+            with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+                futures = {lang: pool.submit(self.step_gemini_pack, items, prompt, lang, shared) for lang, prompt in prompts.items()}
+                for lang, future in futures.items():
+                    results += [(item, lang, ok) for item, ok in future.result()]
+        finally:
+            for uploaded in shared.values():
+                try: self.client.files.delete(name=uploaded.name)
+                except: pass
+        return results
+
+    def _upload_shared(self, items):
+        shared = {}
+        for item in items:
+            src_path = self.paths["EXP_STILLS"] / item['name']
+            if not src_path.exists(): continue
+            data = self.upload_bytes(src_path)
+            self._report_transfer(item['name'], src_path.stat().st_size, len(data))
+            try: shared[item['name']] = self.client.files.upload(file=io.BytesIO(data), config={"mime_type": "image/jpeg"})
+            except Exception as e: print(f"Upload Error {item['name']}: {e}")
+        return shared
+
+    def _generate_packed(self, items, prompt, lang=None):
+        paths = [self.paths["EXP_STILLS"] / item['name'] for item in items]
+        paths = [p for p in paths if p.exists()]
+        if len(paths) < 2: return set()
+
+        sheet, manifest, cols, rows = build_contact_sheet(paths)
+        response = self._generate_content(
+            model="gemini-2.5-flash-image",
+            contents=[PACK_PROMPT.format(count=len(paths), cols=cols, rows=rows) + prompt, sheet],
+        )
+        raw = response_image_bytes(response)
+        sheet_size = sheet.size
+        sheet.close()
+        if not raw: return set()
+
+        packed = set()
+        max_diff = float(self.settings["pack_max_diff"])
+        with Image.open(io.BytesIO(raw)) as src:
+            # Layout check: the grid must come back with the same proportions
+            if abs(src.size[0] / src.size[1] - sheet_size[0] / sheet_size[1]) > 0.03 * sheet_size[0] / sheet_size[1]:
+                print("Packed result has a different layout, falling back to single requests.")
+                return set()
+
+            # Decoded sheet, its RGB copy, the cut tiles and one full-size tile at a time
+            largest = max(frame_bytes(entry["size"]) for entry in manifest)
+            with FRAME_BUDGET.reserve(frame_bytes(src.size, copies=3) + largest):
+                result = src.convert("RGB")
+                tiles = split_contact_sheet(result, sheet_size, manifest)
+                matches = match_tiles([entry["tile"] for entry in manifest], tiles, max_diff)
+                for entry, tile, ok in zip(manifest, tiles, matches):
+                    if ok:
+                        out = tile.resize(entry["size"], Image.LANCZOS)
+                        save_name = f"GEMINI_{entry['path'].stem}.jpg"
+                        save_path = self._write_output(lang, save_name, jpeg_bytes(out))
+                        out.close()
+                        digest = self.store.digest_of(entry['path'])
+                        if digest: self.store.remember_response(self.store.response_key("gemini-2.5-flash-image", prompt, digest), save_path)
+                        packed.add(entry['path'].name)
+                    tile.close()
+                result.close()
+        if len(packed) < len(manifest):
+            print(f"{len(manifest) - len(packed)} packed tile(s) did not match their still, sending them singly.")
+        return packed
+
+    def import_item(self, item, lang=None):
+        """Imports and appends a single generated clip as soon as it is ready."""
+        gemini_name = f"GEMINI_{Path(item['name']).stem}.jpg"
+        gen_path = self.received_dir(lang) / gemini_name
+        imported_key = f"{lang or ''}/{gemini_name}"
+        if imported_key in self.imported or not gen_path.exists(): return False
+
+        media_pool = self.project.GetMediaPool()
+        target_bin = self._get_target_bin(media_pool, lang)
+        imported = media_pool.ImportMedia([str(gen_path)])
+        target_clip = imported[0] if imported else None
+        if not target_clip: return False
+
+        track = self.track_for(lang)
+        self._ensure_track_exists(track, lang)
+        fps = float(self.tl.GetSetting("timelineFrameRate"))
+        dur_int = int(float(item['Duration']))
+        target_clip.SetMarkInOut(1, dur_int)
+        media_pool.AppendToTimeline([{
+            'mediaPoolItem': target_clip,
+            'timeline': self.tl, 
+            'startFrame': 0,
+            'endFrame': dur_int,
+            'recordFrame': self._tc_to_frame(item['RecTC'], fps),
+            'trackIndex': track,
+            'mediaType': 1 
+        }])
+        self.imported.add(imported_key)
+        self.store.pin([gen_path])
+        return True
+
     def import_to_timeline(self):
+        if not self.paths["JSON"].exists(): return False, "JSON Map missing."
+        for lang in self.output_languages():
+            self._import_language(lang)
+        langs = ", ".join(l for l in self.output_languages() if l)
+        return True, f"Clips appended ({langs})." if langs else "Clips appended."
+
+    def _import_language(self, lang=None):
         media_pool = self.project.GetMediaPool()
-        root_folder = media_pool.GetRootFolder()
-        target_bin = None
-        for f in root_folder.GetSubFolderList():
-            if f.GetName() == "FROM_GEMINI": target_bin = f; break
-        if not target_bin: target_bin = media_pool.AddSubFolder(root_folder, "FROM_GEMINI")
-        media_pool.SetCurrentFolder(target_bin)
+        target_bin = self._get_target_bin(media_pool, lang)
+        received = self.received_dir(lang)
+        prefix = f"{lang or ''}/"
         
-        files = [str(p) for p in self.paths["RECEIVED"].glob("*.jpg")]
-        if files: media_pool.ImportMedia(files)
+        # Clips already imported as they became ready are skipped
+        files = [str(p) for p in self.store.list(received) if prefix + p.name not in self.imported]
+        if files:
+            media_pool.ImportMedia(files)
+            self.store.pin(files)
         
-        if not self.paths["JSON"].exists(): return False, "JSON Map missing."
         with open(self.paths["JSON"], 'r', encoding='utf-8') as f: data_map = json.load(f)
         
         clips = target_bin.GetClipList()
         fps = float(self.tl.GetSetting("timelineFrameRate"))
         append_data = []
+        track = self.track_for(lang)
         
-        # --- FIX: ENSURE TRACK 2 EXISTS (BATCH) ---
-        self._ensure_track_2_exists()
-        # ------------------------------------------
+        # --- FIX: ENSURE TRACK EXISTS (BATCH) ---
+        self._ensure_track_exists(track, lang)
+        # ----------------------------------------
 
         for item in data_map:
             gemini_name = f"GEMINI_{Path(item['name']).stem}.jpg"
+            if prefix + gemini_name in self.imported: continue
             target_clip = next((c for c in clips if c.GetName() == gemini_name), None)
             if target_clip:
                 rec_tc = item['RecTC']
@@ -416,9 +2028,9 @@ class GeminiProcessor:
                     'startFrame': 0,
                     'endFrame': dur_int,
                     'recordFrame': rec_frame,
-                    'trackIndex': 2,
+                    'trackIndex': track,
                     'mediaType': 1 
                 })
+                self.imported.add(prefix + gemini_name)
 
-        if append_data: media_pool.AppendToTimeline(append_data)
-        return True, "Clips appended."
\ No newline at end of file
+        if append_data: media_pool.AppendToTimeline(append_data)
\ No newline at end of file